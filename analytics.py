@@ -0,0 +1,138 @@
+"""Rejection analytics over columnar, integer-coded story data.
+
+Stories are flattened into parallel arrays of category codes (platform,
+batch, month, rejection reason) plus a CSR-style tag layout (offsets +
+codes). Group-bys are counts over zipped code arrays, which run inside
+``Counter``'s C loop instead of touching the story dicts again. Stories are
+append-only, so each sync only encodes and counts the newly added tail.
+"""
+from array import array
+from collections import Counter
+from itertools import combinations
+
+UNKNOWN = 'Unknown'
+
+
+class Codebook:
+    """Maps category strings to dense integer codes and back."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        value = value or UNKNOWN
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+
+def _month(story):
+    """YYYY-MM of the rejection, falling back to the submission date."""
+    return (story.get('rejection_date') or story.get('created_at') or '')[:7]
+
+
+class StoryColumns:
+    """Column-oriented view of the story list with running group-by counts."""
+
+    def __init__(self):
+        self.platforms = Codebook()
+        self.batches = Codebook()
+        self.months = Codebook()
+        self.reasons = Codebook()
+        self.tags = Codebook()
+
+        self.ids = []
+        self.platform = array('I')
+        self.batch = array('I')
+        self.month = array('I')
+        self.reason = array('I')
+        self.tag_offsets = array('I', [0])
+        self.tag = array('I')
+        self.tag_reason = array('I')  # reason code repeated once per tag
+
+        self.reason_counts = Counter()
+        self.platform_counts = Counter()
+        self.by_platform = Counter()
+        self.by_batch = Counter()
+        self.by_month = Counter()
+        self.by_tag = Counter()
+        self.tag_pairs = Counter()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sync(self, stories):
+        """Bring the columns up to date with an append-only story list."""
+        n = len(self.ids)
+        if len(stories) < n or (n and stories[n - 1].get('id') != self.ids[-1]):
+            self.__init__()
+            n = 0
+        if len(stories) > n:
+            self.extend(stories[n:])
+
+    def extend(self, stories):
+        """Encode new stories, then fold only the new slice into the counts."""
+        start, tag_start = len(self.ids), len(self.tag)
+        for s in stories:
+            reason = self.reasons.code(s.get('rejection_reason'))
+            self.ids.append(s.get('id'))
+            self.platform.append(self.platforms.code(s.get('platform')))
+            self.batch.append(self.batches.code(s.get('batch')))
+            self.month.append(self.months.code(_month(s)))
+            self.reason.append(reason)
+            tags = [self.tags.code(t) for t in dict.fromkeys(s.get('tags', []))]
+            self.tag.extend(tags)
+            self.tag_reason.extend([reason] * len(tags))
+            self.tag_offsets.append(len(self.tag))
+            if len(tags) > 1:
+                self.tag_pairs.update(combinations(sorted(tags), 2))
+
+        reason = self.reason[start:]
+        self.reason_counts.update(reason)
+        self.platform_counts.update(self.platform[start:])
+        self.by_platform.update(zip(self.platform[start:], reason))
+        self.by_batch.update(zip(self.batch[start:], reason))
+        self.by_month.update(zip(self.month[start:], reason))
+        self.by_tag.update(zip(self.tag[tag_start:], self.tag_reason[tag_start:]))
+
+    def summary(self, limit=5):
+        """Break rejection reasons down by platform, batch, month and tag."""
+        total = len(self)
+        by_month = _grouped(self.by_month, self.months, self.reasons, limit)
+        by_month.sort(key=lambda x: x['group'])
+        return {
+            'total': total,
+            'reasons': [{'reason': self.reasons.values[r], 'count': c,
+                         'percent': round(c / total * 100) if total > 0 else 0}
+                        for r, c in self.reason_counts.most_common()],
+            'platforms': {self.platforms.values[p]: c
+                          for p, c in self.platform_counts.most_common()},
+            'by_platform': _grouped(self.by_platform, self.platforms, self.reasons, limit),
+            'by_batch': _grouped(self.by_batch, self.batches, self.reasons, limit),
+            'by_month': by_month,
+            'by_tag': _grouped(self.by_tag, self.tags, self.reasons, limit),
+            'tag_pairs': [{'tags': [self.tags.values[a], self.tags.values[b]], 'count': c}
+                          for (a, b), c in self.tag_pairs.most_common(25)],
+        }
+
+
+def _grouped(counts, keybook, reasonbook, limit):
+    """Turn a Counter of (group, reason) codes into sorted nested lists."""
+    groups = {}
+    totals = Counter()
+    for (g, r), count in counts.items():
+        groups.setdefault(g, []).append((count, r))
+        totals[g] += count
+    result = []
+    for g, total in totals.most_common():
+        rows = sorted(groups[g], reverse=True)[:limit]
+        result.append({
+            'group': keybook.values[g],
+            'total': total,
+            'reasons': [{'reason': reasonbook.values[r], 'count': c,
+                         'percent': round(c / total * 100)} for c, r in rows],
+        })
+    return result
@@ -1,25 +1,182 @@
 import os
+import hmac
 import json
 import uuid
+import time
+import fcntl
+import threading
+import click
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, abort
+from functools import partial
+from operator import attrgetter
+from contextlib import contextmanager
+from flask import (Flask, Blueprint, render_template, request, redirect, url_for, jsonify, flash, abort, g,
+                   current_app, has_request_context, before_render_template, template_rendered, Response)
+from markupsafe import Markup, escape
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
+from jinja2 import FileSystemBytecodeCache
+from leaderboard import VoteRollups, WINDOWS
+from analytics import StoryColumns
+from related import RelatedStories
+from suggest import SuggestIndex
+from search_index import SearchIndex, EXACT
+from metrics import Metrics
+from profiling import RequestProfiler
+from story_store import StoryStore, BodyStore
+from vote_dedup import VoteDeduper
+from tasks import TaskQueue
+from changefeed import FileChangeFeed, PubSubChangeFeed
+from live import LiveUpdates, parse_stories
+from feeds import select_feed, atom_feed, parse_time
+from sitemap import Sitemaps
+from planner import QueryPlanner, SearchPredicate
+from near_dup import NearDuplicateIndex, find_duplicates, THRESHOLD as NEAR_DUP_THRESHOLD
+import snapshot
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Defaults for create_app(), from the environment; its `config` argument
+# overrides any of them.
+DATA_DIR = os.environ.get('DATA_DIR') or os.path.join(ROOT_DIR, 'data')
+VOTER_SALT = os.environ.get('VOTER_SALT')  # set to skip the salt file, e.g. on a read-only deploy
+TASK_QUEUE_DB = os.environ.get('TASK_QUEUE_DB')  # SQLite file for a durable task queue
+CHANGE_FEED_URL = os.environ.get('CHANGE_FEED_URL')  # host:port of a feed broker shared by replicas
+METRICS_DIR = os.environ.get('METRICS_DIR')  # default: DATA_DIR/metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token for /metrics scrapes; admins need none
+PROFILE_DIR = os.environ.get('PROFILE_DIR')  # default: DATA_DIR/profiles
+ADMIN_USERS = {u.strip() for u in os.environ.get('ADMIN_USERS', '').split(',') if u.strip()}
+NEAR_DUP_MODE = os.environ.get('NEAR_DUP_MODE', 'flag')  # flag, merge or off
+# Stream live counts over /api/live only where an open stream doesn't hold a
+# whole worker: asgi.py, or gunicorn with an async worker class. Otherwise
+# pages poll /api/counts.
+LIVE_STREAMING = os.environ.get('LIVE_UPDATES') == 'stream'
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR') or os.path.join(ROOT_DIR, '.jinja_cache')
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """Compiled templates on disk, reused by every worker and cold start.
+
+    `flask --app app compile-templates` fills it at build time so a deploy
+    ships with it. If the directory is read-only at runtime, templates are
+    compiled in memory as before.
+    """
+
+    def dump_bytecode(self, bucket):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
 
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
 
 # Flask-Login setup
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-STORIES_FILE = os.path.join(DATA_DIR, 'stories.json')
-COMMENTS_FILE = os.path.join(DATA_DIR, 'comments.json')
-USERS_FILE = os.path.join(DATA_DIR, 'users.json')
-
-os.makedirs(DATA_DIR, exist_ok=True)
+login_manager.login_view = 'main.login'
+
+bp = Blueprint('main', __name__, cli_group=None)
+
+
+class Services:
+    """The stores, indexes and background services behind one app.
+
+    Each app keeps its own on ``app.extensions['services']``; code serving a
+    request (or running in one of the app's task threads) reaches them
+    through the `services` proxy.
+    """
+
+    def __init__(self, app):
+        config = app.config
+        data_dir = self.data_dir = config['DATA_DIR']
+        self.stories_file = os.path.join(data_dir, 'stories.json')
+        self.comments_file = os.path.join(data_dir, 'comments.json')
+        self.users_file = os.path.join(data_dir, 'users.json')
+        self.write_lock_file = os.path.join(data_dir, '.write.lock')
+
+        self.metrics = Metrics(config['METRICS_DIR'] or os.path.join(data_dir, 'metrics'))
+        self.task_queue = TaskQueue(config['TASK_QUEUE_DB'], metrics=self.metrics, context=app.app_context)
+        self.task_queue.task('check_near_duplicate')(check_near_duplicate)
+        # Caches live in each process, so their refreshes never go to a shared queue.
+        self.cache_tasks = TaskQueue(metrics=self.metrics, context=app.app_context)
+        self.cache_tasks.task('warm_caches')(warm_caches)
+        self.cache_tasks.task('refresh_related')(refresh_related)
+        self.change_feed = (PubSubChangeFeed(config['CHANGE_FEED_URL']) if config['CHANGE_FEED_URL']
+                            else FileChangeFeed(os.path.join(data_dir, 'changes.log')))
+
+        self.story_store = StoryStore(BodyStore(os.path.join(data_dir, 'story_bodies.bin'),
+                                                # v2: entries carry a content digest
+                                                os.path.join(data_dir, 'story_bodies.v2.idx')))
+        self.vote_rollups = VoteRollups(os.path.join(data_dir, 'vote_events.bin'))
+        self.vote_dedup = VoteDeduper(os.path.join(data_dir, 'voters.bin'),
+                                      os.path.join(data_dir, 'voter_salt'), config['VOTER_SALT'])
+        self.story_columns = StoryColumns()
+        self.related_stories = RelatedStories(os.path.join(data_dir, 'related.json'),
+                                              in_app_context(app, get_stories))
+        self.suggest_index = SuggestIndex()
+        self.search_index = SearchIndex()
+        self.near_dup_index = NearDuplicateIndex()
+        self.sitemaps = Sitemaps()
+        self.query_planner = QueryPlanner()
+        self.live_updates = LiveUpdates(in_app_context(app, sync_changes))
+
+        # Change feed state; see sync_changes().
+        self.versions = {}        # 'entity.op' -> seq of the last such change applied here
+        self.story_comments = {}  # story id -> its comments, dropped when they change
+        self.sync_lock = threading.RLock()
+        self.generation = 0       # bumped on every full reload
+        self.version_cache = {}
+        self.build_locks = {}
+        self.write_lock = threading.Lock()
+        self.lock_owner = threading.local()  # .held is True in the thread inside storage_lock()
+
+
+services = LocalProxy(lambda: current_app.extensions['services'])
+
+
+def in_app_context(app, fn):
+    """fn, wrapped to run inside an app context (for threads outside a request)."""
+    def call(*args):
+        with app.app_context():
+            return fn(*args)
+    return call
+
+
+def create_app(config=None):
+    """A Flask app with its config, services, routes and template cache.
+
+    `config` overrides the defaults read from the environment, e.g.
+    ``create_app({'DATA_DIR': path})``. Building the app touches no files:
+    the services read the data directory when first used, and reads keep
+    working if it is read-only (once it holds stories.json; seeding an empty
+    one is a write). Writes need it writable.
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.update(
+        SECRET_KEY=os.environ.get('SECRET_KEY') or os.urandom(24),
+        DATA_DIR=DATA_DIR, VOTER_SALT=VOTER_SALT, TASK_QUEUE_DB=TASK_QUEUE_DB,
+        CHANGE_FEED_URL=CHANGE_FEED_URL, METRICS_DIR=METRICS_DIR, METRICS_TOKEN=METRICS_TOKEN,
+        PROFILE_DIR=PROFILE_DIR, PROFILE_SAMPLE_RATE=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        PROFILE_FORMAT=os.environ.get('PROFILE_FORMAT', 'pstats'), ADMIN_USERS=ADMIN_USERS,
+        NEAR_DUP_MODE=NEAR_DUP_MODE, LIVE_STREAMING=LIVE_STREAMING, JINJA_CACHE_DIR=JINJA_CACHE_DIR,
+    )
+    flask_app.config.update(config or {})
+    if os.environ.get('PROXY_COUNT'):
+        # Behind N reverse proxies, take the client address from X-Forwarded-For.
+        flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_for=int(os.environ['PROXY_COUNT']))
+    login_manager.init_app(flask_app)
+    flask_app.jinja_env.bytecode_cache = TemplateBytecodeCache(flask_app.config['JINJA_CACHE_DIR'])
+
+    flask_app.extensions['services'] = Services(flask_app)
+    flask_app.register_blueprint(bp)
+    before_render_template.connect(start_render, flask_app)
+    template_rendered.connect(record_render, flask_app)
+    # Profile a request with ?_profile=1 (or =collapsed) or an X-Profile header
+    # as an admin, or sample a share of all requests with PROFILE_SAMPLE_RATE.
+    RequestProfiler(flask_app, flask_app.config['PROFILE_DIR'] or
+                    os.path.join(flask_app.config['DATA_DIR'], 'profiles'),
+                    is_admin=is_admin, sample_rate=flask_app.config['PROFILE_SAMPLE_RATE'],
+                    sample_format=flask_app.config['PROFILE_FORMAT'])
+    return flask_app
 
 
 class User(UserMixin):
@@ -30,11 +187,11 @@ class User(UserMixin):
 
 
 def load_users():
-    return load_json(USERS_FILE, {})
+    return load_json(services.users_file, {})
 
 
 def save_users(users):
-    save_json(USERS_FILE, users)
+    save_json(services.users_file, users)
 
 
 def get_user_by_username(username):
@@ -58,115 +215,521 @@ def load_user(user_id):
     return get_user_by_id(user_id)
 
 
+# ─── Instrumentation ──────────────────────────────────────────────────────────
+
+def timed_phase(phase):
+    """Time a block as one phase of the current request (or of background work)."""
+    endpoint = (request.endpoint or 'unknown') if has_request_context() else 'background'
+    return services.metrics.timed('phase_duration_seconds', (('endpoint', endpoint), ('phase', phase)))
+
+
+@bp.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@bp.after_app_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        services.metrics.observe('http_request_duration_seconds',
+                        (('endpoint', request.endpoint or 'unknown'), ('method', request.method)),
+                        time.perf_counter() - started)
+    services.metrics.maybe_flush()
+    return response
+
+
+def is_admin():
+    return current_user.is_authenticated and current_user.username in current_app.config['ADMIN_USERS']
+
+
+def start_render(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+def record_render(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        services.metrics.observe('phase_duration_seconds',
+                        (('endpoint', request.endpoint or 'unknown'), ('phase', 'render')),
+                        time.perf_counter() - started)
+
+
 def load_json(filepath, default=None):
     if default is None:
         default = []
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return default
-    return default
+    try:
+        f = open(filepath, 'rb')
+    except FileNotFoundError:
+        return default
+    with timed_phase('storage_load'), f:
+        source = snapshot.stamp(os.fstat(f.fileno()))
+        data = snapshot.read(snapshot.path_for(filepath), source)
+        if data is not None:
+            services.metrics.inc('snapshot_loads_total', (('file', os.path.basename(filepath)), ('result', 'hit')))
+            return data
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError:
+            return default
+    # The JSON was written by something else (or before snapshots existed):
+    # take a snapshot of what was just read so the next load is fast.
+    services.metrics.inc('snapshot_loads_total', (('file', os.path.basename(filepath)), ('result', 'miss')))
+    try:
+        write_snapshot(filepath, data, source)
+    except OSError:
+        pass
+    return data
+
+
+def write_snapshot(filepath, data, source):
+    """Snapshot data read from filepath, if the file is still the one stamped `source`.
+
+    Only under the storage lock, so no save can land between the check and
+    the write and leave an older snapshot stamped as current.
+    """
+    if not getattr(services.lock_owner, 'held', False):
+        with storage_lock():
+            return write_snapshot(filepath, data, source)
+    if snapshot.stamp(os.stat(filepath)) == source:
+        snapshot.write(snapshot.path_for(filepath), data, source)
 
 
 def save_json(filepath, data):
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    # Write to a temp file and rename, so concurrent readers never see a
+    # half-written file (and mistake it for an empty store).
+    os.makedirs(services.data_dir, exist_ok=True)
+    tmp = '%s.%d.%d.tmp' % (filepath, os.getpid(), threading.get_ident())
+    with timed_phase('storage_save'):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            written = f.tell()
+            source = snapshot.stamp(os.fstat(f.fileno()))
+        # Checkpoint: the snapshot is stamped with the JSON it mirrors, so it
+        # is never used if the rename below doesn't happen.
+        snapshot.write(snapshot.path_for(filepath), data, source)
+        os.replace(tmp, filepath)
+    services.metrics.inc('storage_bytes_written_total', (('file', os.path.basename(filepath)),), written)
 
 
 def load_stories():
-    return load_json(STORIES_FILE, [])
+    return load_json(services.stories_file, [])
 
 
 def save_stories(stories):
-    save_json(STORIES_FILE, stories)
+    save_json(services.stories_file, stories)
 
 
 def load_comments():
-    return load_json(COMMENTS_FILE, [])
+    return load_json(services.comments_file, [])
 
 
 def save_comments(comments):
-    save_json(COMMENTS_FILE, comments)
+    save_json(services.comments_file, comments)
 
 
 def seed_if_needed():
-    """Auto-seed database on first visit."""
+    """Auto-seed database on first visit; fill in comment counts on older data.
+
+    Missing counts are only computed in memory, so reads never write. The
+    next comment persists them, as does `flask recount-comments`.
+    """
     stories = load_stories()
     if len(stories) == 0:
         from seed_data import get_seed_stories, get_seed_comments
         stories = get_seed_stories()
-        save_stories(stories)
         comments = get_seed_comments(stories)
+        count_comments(stories, comments)
+        save_stories(stories)
         save_comments(comments)
+    elif any('comment_count' not in story for story in stories):
+        count_comments(stories, load_comments())
     return stories
 
 
-def get_rejection_reason_stats(stories):
-    """Calculate rejection reason percentages for sidebar."""
-    reasons = {}
-    for s in stories:
-        reason = s.get('rejection_reason', 'Unknown')
-        reasons[reason] = reasons.get(reason, 0) + 1
-    total = len(stories)
-    stats = []
-    for reason, count in sorted(reasons.items(), key=lambda x: -x[1]):
-        stats.append({
-            'reason': reason,
-            'count': count,
-            'percent': round(count / total * 100) if total > 0 else 0
-        })
-    return stats[:10]
-
-
-def get_platform_stats(stories):
-    """Calculate platform distribution."""
-    platforms = {}
-    for s in stories:
-        p = s.get('platform', 'Unknown')
-        platforms[p] = platforms.get(p, 0) + 1
-    return dict(sorted(platforms.items(), key=lambda x: -x[1]))
-
-
-def get_all_tags(stories):
+def count_comments(stories, comments):
+    """Set every story's comment_count and last_activity_at from the full comment list."""
+    activity = {}
+    for comment in comments:
+        count, latest = activity.get(comment.get('story_id'), (0, ''))
+        activity[comment.get('story_id')] = (count + 1, max(latest, comment.get('created_at', '')))
+    for story in stories:
+        count, latest = activity.get(story['id'], (0, ''))
+        story['comment_count'] = count
+        story['last_activity_at'] = max(latest, story.get('created_at', ''))
+
+
+# ─── Change feed ──────────────────────────────────────────────────────────────
+# Every write publishes the entities it touched. Each worker folds those
+# entries into its own caches, so peers' writes show up without reloading the
+# data files, and caches are keyed on the kinds of change they depend on.
+
+
+def publish_change(entity, op, items):
+    """Tell every worker and replica which entities a write touched."""
+    services.change_feed.publish(entity, op, [item['id'] for item in items], items)
+
+
+def sync_changes():
+    """Apply changes published since the last call; reload if any were missed."""
+    with services.sync_lock:
+        entries = services.change_feed.changes() if services.generation else None
+        if entries and any(e['op'] not in ('create', 'update', 'activity', 'duplicate') for e in entries):
+            entries = None  # a rewrite (e.g. dedupe) can't be applied piecemeal
+        if entries is None:
+            services.change_feed.seek_end()
+            services.story_store.sync(seed_if_needed())
+            services.story_comments.clear()
+            services.generation += 1
+            services.metrics.inc('cache_reloads_total')
+            return
+        for entry in entries:
+            apply_change(entry)
+
+
+def apply_change(entry):
+    entity, op = entry['entity'], entry['op']
+    services.versions['%s.%s' % (entity, op)] = entry['seq']
+    if entity == 'story':
+        for story in entry['data']:
+            record = services.story_store.get(story['id'])
+            if record is None:
+                services.story_store.add(story)
+            elif op == 'activity':
+                record.comment_count = story['comment_count']
+                record.last_activity_at = story['last_activity_at']
+            elif op == 'duplicate':
+                record.extra = dict(record.extra or {}, duplicate_of=story['duplicate_of'],
+                                    duplicate_score=story['duplicate_score'])
+            else:
+                record.votes = story.get('votes', record.votes)
+                services.live_updates.story_votes(record.id, record.votes)
+    elif entity == 'comment':
+        for comment in entry['data']:
+            services.story_comments.pop(comment['story_id'], None)
+            if op == 'create':
+                services.live_updates.comment_added(comment['story_id'])
+            else:
+                services.live_updates.comment_votes(comment['story_id'], comment['id'], comment['votes'])
+    services.metrics.inc('changes_applied_total', (('entity', entity), ('op', op)))
+
+
+def cached(name, build, depends):
+    """Return build(), memoised until a change of a kind in `depends` arrives."""
+    sync_changes()
+    version = (services.generation,) + tuple(services.versions.get(kind, 0) for kind in depends)
+    entry = services.version_cache.get(name)
+    if entry is None or entry[0] != version:
+        # One build per cache at a time: the builders sync shared indexes.
+        with services.build_locks.setdefault(name, threading.Lock()):
+            entry = services.version_cache.get(name)
+            if entry is None or entry[0] != version:
+                services.metrics.inc('cache_misses_total', (('cache', name),))
+                entry = (version, build())
+                services.version_cache[name] = entry
+                return entry[1]
+    services.metrics.inc('cache_hits_total', (('cache', name),))
+    return entry[1]
+
+
+def get_stories():
+    """Compact story records, kept current from the change feed."""
+    sync_changes()
+    return services.story_store.records
+
+
+def get_story_comments(story_id):
+    """A story's comments, cached until the feed reports a change to them."""
+    sync_changes()
+    comments = services.story_comments.get(story_id)
+    if comments is not None:
+        return comments
+    # Read the file without holding the sync lock; only cache the result if
+    # no comment change or reload was applied while it was being read.
+    version = _comments_version()
+    comments = [c for c in load_comments() if c.get('story_id') == story_id]
+    with services.sync_lock:
+        sync_changes()
+        if _comments_version() == version:
+            services.story_comments[story_id] = comments
+    return comments
+
+
+def _comments_version():
+    versions = services.versions
+    return services.generation, versions.get('comment.create', 0), versions.get('comment.update', 0)
+
+
+def get_analytics():
+    """Rejection reason breakdowns, recomputed only when data changes."""
+    def build():
+        services.story_columns.sync(get_stories())
+        return services.story_columns.summary()
+    return cached('analytics', build, ('story.create',))
+
+
+def get_suggest_index():
+    """Prefix index for autocomplete, synced when stories change."""
+    def build():
+        services.suggest_index.sync(get_stories())
+        return services.suggest_index
+    return cached('suggest', build, ('story.create', 'story.update'))
+
+
+def get_search_index():
+    """Word and trigram index for feed search, synced when stories change."""
+    def build():
+        services.search_index.sync(get_stories())
+        return services.search_index
+    return cached('search', build, ('story.create',))
+
+
+def get_near_dup_index():
+    """MinHash LSH index for spotting resubmitted stories."""
+    def build():
+        return services.near_dup_index.sync(get_stories())
+    return cached('near_dups', build, ('story.create',))
+
+
+def near_dup_index_ready():
+    """True once this worker has built the index; later syncs only add new stories."""
+    return 'near_dups' in services.version_cache
+
+
+def warm_caches():
+    """Rebuild the read caches after a write, before the next page view needs them."""
+    get_analytics()
+    get_search_index()
+    get_suggest_index()
+    get_near_dup_index()
+    get_query_planner()
+
+
+def refresh_related():
+    services.related_stories.refresh()
+
+
+def check_near_duplicate(story_id):
+    """Flag a story accepted while the near-duplicate index was still cold."""
+    index = get_near_dup_index()
+    with storage_lock():
+        stories = load_stories()
+        story = next((s for s in reversed(stories) if s['id'] == story_id), None)
+        match = index.find(story) if story is not None and 'duplicate_of' not in story else None
+        if not match:
+            return
+        original_id, score = match
+        story['duplicate_of'] = original_id
+        story['duplicate_score'] = round(score, 2)
+        save_stories(stories)
+        publish_change('story', 'duplicate', [{'id': story_id, 'duplicate_of': original_id,
+                                                'duplicate_score': story['duplicate_score']}])
+    services.metrics.inc('near_duplicates_total', (('action', 'flag'),))
+
+
+def get_feed(platform=None, tag=None):
+    """The newest stories for a feed, kept until a story is added."""
+    return cached('feed:%s:%s' % (platform or '', tag or ''),
+                  lambda: select_feed(get_stories(), platform, tag), ('story.create',))
+
+
+def get_sitemaps():
+    """Sitemap shards of the story pages; only the last one changes as stories arrive."""
+    return cached('sitemaps', lambda: services.sitemaps.sync(get_stories()), ('story.create',))
+
+
+def get_query_planner():
+    """Facet lists for planning feed queries, synced when stories are added."""
+    return cached('planner', lambda: services.query_planner.sync(get_stories()), ('story.create',))
+
+
+def get_all_tags():
     """Get all unique tags."""
-    tags = set()
-    for s in stories:
-        for t in s.get('tags', []):
-            tags.add(t)
-    return sorted(tags)
+    return sorted(get_query_planner().values('tag'))
 
 
-def get_all_batches(stories):
+def get_all_batches():
     """Get all unique batches."""
-    batches = set()
-    for s in stories:
-        b = s.get('batch', '')
-        if b:
-            batches.add(b)
-    return sorted(batches, reverse=True)
+    return sorted(get_query_planner().values('batch'), reverse=True)
+
+
+# ─── Writes ───────────────────────────────────────────────────────────────────
+# Shared by the WSGI routes and the async endpoints in asgi.py, which hand
+# over everything queued since their last pass as one batch.
+
+DUPLICATE_VOTE = {'success': False, 'duplicate': True, 'error': 'Already voted'}
+MAX_VOTE_BATCH = 100
+BAD_VOTE_BATCH = {'success': False, 'error': 'Expected {"votes": [...]} with 1-%d votes' % MAX_VOTE_BATCH}
+
+@contextmanager
+def storage_lock():
+    """Serialise load/modify/save cycles across threads and worker processes."""
+    # The data directory is created by the first write, not at import.
+    os.makedirs(services.data_dir, exist_ok=True)
+    with services.write_lock, open(services.write_lock_file, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        services.lock_owner.held = True
+        try:
+            yield
+        finally:
+            services.lock_owner.held = False
+
+
+def voter_hash(user_id, remote_addr):
+    """One vote per item for each account, or for each client IP when anonymous."""
+    if user_id:
+        return services.vote_dedup.voter_hash('user:' + user_id)
+    return services.vote_dedup.voter_hash('ip:' + (remote_addr or ''))
+
+
+def apply_votes(votes):
+    """Apply (kind, item_id, direction, voter) votes with one save per file.
+
+    Returns a (status, votes) pair per vote, where status is 'ok',
+    'duplicate' or 'missing'.
+    """
+    results = [('missing', None)] * len(votes)
+    with storage_lock():
+        for kind, load, save in (('story', load_stories, save_stories),
+                                 ('comment', load_comments, save_comments)):
+            pending = [i for i, v in enumerate(votes) if v[0] == kind]
+            if not pending:
+                continue
+            items = load()
+            by_id = {}
+            for item in items:
+                by_id.setdefault(item['id'], item)
+            applied, voted = [], set()
+            for i in pending:
+                _, item_id, direction, voter = votes[i]
+                item = by_id.get(item_id)
+                if item is None:
+                    continue
+                if (item_id, voter) in voted or services.vote_dedup.seen(kind, item_id, voter):
+                    results[i] = ('duplicate', None)
+                    continue
+                voted.add((item_id, voter))
+                before = item.get('votes', 0)
+                if direction == 'up':
+                    item['votes'] = before + 1
+                else:
+                    item['votes'] = max(0, before - 1)
+                applied.append((item_id, voter, item['votes'] - before))
+                results[i] = ('ok', item['votes'])
+            if not applied:
+                continue
+            save(items)
+            publish_change(kind, 'update', [_vote_change(by_id[item_id])
+                                            for item_id in dict.fromkeys(i for i, _, _ in applied)])
+            for item_id, voter, delta in applied:
+                if kind == 'story' and delta:
+                    services.vote_rollups.record(item_id, delta)
+                services.vote_dedup.record(kind, item_id, voter)
+                services.metrics.inc('votes_total', (('type', kind),))
+    return results
+
+
+def _vote_change(item):
+    change = {'id': item['id'], 'votes': item['votes']}
+    if 'story_id' in item:
+        change['story_id'] = item['story_id']
+    return change
+
+
+def parse_vote_batch(data, voter):
+    """(kind, item_id, direction, voter) tuples from a /api/vote/batch body, or None."""
+    ops = data.get('votes') if isinstance(data, dict) else None
+    if not isinstance(ops, list) or not 0 < len(ops) <= MAX_VOTE_BATCH:
+        return None
+    if not all(isinstance(op, dict) and isinstance(op.get('id'), str) for op in ops):
+        return None
+    return [('story' if op.get('type', 'story') == 'story' else 'comment', op.get('id'),
+             op.get('direction', 'up'), voter) for op in ops]
+
+
+def vote_batch_response(votes, results):
+    """The /api/vote/batch payload: one result per vote, in request order."""
+    items = []
+    for (kind, item_id, _, _), (status, count) in zip(votes, results):
+        if status == 'duplicate':
+            services.metrics.inc('votes_rejected_total', (('type', kind),))
+        items.append({'type': kind, 'id': item_id, 'status': status, 'votes': count})
+    return {'success': True, 'results': items}
+
+
+def build_comment(data):
+    """A new comment from request JSON, or None if required fields are missing."""
+    story_id = data.get('story_id')
+    author = data.get('author', 'Anonymous')
+    text = data.get('text', '')
+    parent_id = data.get('parent_id')
+
+    if not isinstance(text, str) or not isinstance(story_id, str):
+        return None
+    text = text.strip()
+    if not text or not story_id:
+        return None
+
+    return {
+        'id': 'c' + str(uuid.uuid4())[:7],
+        'story_id': story_id,
+        'author': author or 'Anonymous',
+        'text': text,
+        'parent_id': parent_id,
+        'votes': 0,
+        'created_at': datetime.utcnow().isoformat() + 'Z'
+    }
+
+
+def add_comments(new_comments):
+    """Append comments with a single save, and bump their stories' comment counts."""
+    with storage_lock():
+        comments = load_comments()
+        comments.extend(new_comments)
+        save_comments(comments)
+        stories = load_stories()
+        backfill = any('comment_count' not in story for story in stories)
+        if backfill:
+            count_comments(stories, comments)  # data from before comment counts; new ones included
+        by_id = {story['id']: story for story in stories}
+        touched = {}
+        for comment in new_comments:
+            story = by_id.get(comment['story_id'])
+            if story is None:
+                continue
+            if not backfill:
+                story['comment_count'] += 1
+            story['last_activity_at'] = max(story.get('last_activity_at', ''), comment['created_at'])
+            touched[story['id']] = story
+        if touched:
+            save_stories(stories)
+            publish_change('story', 'activity', [
+                {'id': s['id'], 'comment_count': s['comment_count'], 'last_activity_at': s['last_activity_at']}
+                for s in touched.values()])
+        publish_change('comment', 'create', new_comments)
+    services.metrics.inc('comments_total', value=len(new_comments))
 
 
 # ─── Routes ───────────────────────────────────────────────────────────────────
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if request.method == 'POST':
+        from werkzeug.security import generate_password_hash  # only sign-ups pay for the import
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '')
         if not username or not password:
             flash('Username and password are required', 'error')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         if len(password) < 6:
             flash('Password must be at least 6 characters', 'error')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         existing_user = get_user_by_username(username)
         if existing_user:
             flash('Username already exists', 'error')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         users = load_users()
         user_id = str(uuid.uuid4())
         users[user_id] = {
@@ -174,95 +737,147 @@ def register():
             'password_hash': generate_password_hash(password)
         }
         save_users(users)
+        services.change_feed.publish('user', 'create', [user_id])
         flash('Registration successful! Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if request.method == 'POST':
+        from werkzeug.security import check_password_hash
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '')
         user = get_user_by_username(username)
         if user and check_password_hash(user.password_hash, password):
             login_user(user)
             next_page = request.args.get('next')
-            return redirect(next_page or url_for('index'))
+            return redirect(next_page or url_for('main.index'))
         flash('Invalid username or password', 'error')
     return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+PAGE_SIZE = 30
+
+
+def snippet_html(segments):
+    """A search snippet as HTML, with the matched words in <mark>."""
+    return Markup(''.join('<mark>%s</mark>' % escape(text) if hit else escape(text) for text, hit in segments))
+
+
+def substring_match(query):
+    """The feed's plain substring search, for queries with no indexable words."""
+    q = query.lower()
+    return lambda s: (q in s.get('title', '').lower() or
+                      q in s.get('story', '').lower() or
+                      q in s.get('key_learning', '').lower() or
+                      q in s.get('company_name', '').lower() or
+                      q in s.get('founder_name', '').lower())
 
-@app.route('/')
+
+@bp.route('/')
 def index():
-    stories = seed_if_needed()
-
-    # Sorting
-    sort = request.args.get('sort', 'top')
-    if sort == 'new':
-        stories_sorted = sorted(stories, key=lambda x: x.get('created_at', ''), reverse=True)
-    else:  # top
-        stories_sorted = sorted(stories, key=lambda x: x.get('votes', 0), reverse=True)
-
-    # Filtering
-    platform_filter = request.args.get('platform', '')
-    tag_filter = request.args.get('tag', '')
-    batch_filter = request.args.get('batch', '')
-    search_query = request.args.get('q', '')
-
-    if platform_filter:
-        stories_sorted = [s for s in stories_sorted if s.get('platform') == platform_filter]
-    if tag_filter:
-        stories_sorted = [s for s in stories_sorted if tag_filter in s.get('tags', [])]
-    if batch_filter:
-        stories_sorted = [s for s in stories_sorted if s.get('batch') == batch_filter]
-    if search_query:
-        q = search_query.lower()
-        stories_sorted = [s for s in stories_sorted if
-                          q in s.get('title', '').lower() or
-                          q in s.get('story', '').lower() or
-                          q in s.get('key_learning', '').lower() or
-                          q in s.get('company_name', '').lower() or
-                          q in s.get('founder_name', '').lower()]
+    stories = get_stories()
+
+    with timed_phase('filter_sort'):
+        # Sorting
+        sort = request.args.get('sort', 'top')
+        window_votes = {}
+        if sort == 'new':
+            key = attrgetter('created_at')
+        elif sort == 'active':
+            key = attrgetter('last_activity_at')
+        elif sort in WINDOWS:
+            window_votes = services.vote_rollups.window_totals(sort)
+            key = lambda x: (window_votes.get(x.id, 0), x.votes)
+        else:  # top
+            key = attrgetter('votes')
+        page = max(1, request.args.get('page', 1, type=int))
+
+        # Filtering: the planner starts from the most selective predicate and
+        # keeps only the stories up to the end of this page.
+        platform_filter = request.args.get('platform', '')
+        tag_filter = request.args.get('tag', '')
+        batch_filter = request.args.get('batch', '')
+        search_query = request.args.get('q', '')
+        filters = [(facet, value) for facet, value in
+                   (('platform', platform_filter), ('tag', tag_filter), ('batch', batch_filter)) if value]
+        search = scan = None
+        if search_query:
+            index_ = get_search_index()
+            matched = index_.match_query(search_query)
+            if matched is None:
+                scan = substring_match(search_query)
+            else:
+                # Exact hits first, then typo matches by edit count, each
+                # group in the requested order.
+                search = SearchPredicate(index_, search_query, matched)
+        total_results, top, plan = get_query_planner().select(filters, key, page * PAGE_SIZE, search, scan)
+        page_stories = top[(page - 1) * PAGE_SIZE:]
+
+        fuzzy_ids = set()
+        snippets = {}
+        if search is not None:
+            fuzzy_ids = {s.id for s in page_stories if search.ranks[s.id][0] != EXACT}
+            read_bytes = services.story_store.texts.read_bytes
+            pattern = index_.highlighter(matched)
+            for s in page_stories:
+                snippet = index_.snippet(s.id, matched, partial(read_bytes, s.id), pattern)
+                if snippet:
+                    snippets[s.id] = snippet_html(snippet)
+
+    if current_app.debug and request.args.get('explain'):
+        return Response(plan.explain(), mimetype='text/plain')
+
+    def page_url(n):
+        return url_for('main.index', **dict(request.args.to_dict(), page=n))
 
     # Stats for sidebar
-    reason_stats = get_rejection_reason_stats(stories)
-    platform_stats = get_platform_stats(stories)
-    all_tags = get_all_tags(stories)
-    all_batches = get_all_batches(stories)
+    analytics = get_analytics()
+    reason_stats = analytics['reasons'][:10]
+    platform_stats = analytics['platforms']
+    all_tags = get_all_tags()
+    all_batches = get_all_batches()
 
     return render_template('index.html',
-                           stories=stories_sorted,
+                           stories=page_stories,
                            total_stories=len(stories),
+                           total_results=total_results,
                            sort=sort,
+                           window_votes=window_votes,
                            platform_filter=platform_filter,
                            tag_filter=tag_filter,
                            batch_filter=batch_filter,
                            search_query=search_query,
+                           fuzzy_ids=fuzzy_ids,
+                           snippets=snippets,
+                           prev_url=page_url(page - 1) if page > 1 else None,
+                           next_url=page_url(page + 1) if page * PAGE_SIZE < total_results else None,
                            reason_stats=reason_stats,
                            platform_stats=platform_stats,
                            all_tags=all_tags,
                            all_batches=all_batches)
 
 
-@app.route('/story/<story_id>')
+@bp.route('/story/<story_id>')
 def story_detail(story_id):
-    stories = seed_if_needed()
-    story = next((s for s in stories if s['id'] == story_id), None)
-    if not story:
+    get_stories()
+    record = services.story_store.get(story_id)
+    if not record:
         abort(404)
+    story = record.as_dict()
 
-    comments = load_comments()
-    story_comments = [c for c in comments if c.get('story_id') == story_id]
+    story_comments = get_story_comments(story_id)
 
     # Build threaded comments
     top_level = [c for c in story_comments if c.get('parent_id') is None]
@@ -277,13 +892,18 @@ def story_detail(story_id):
                            story=story,
                            comments=top_level,
                            get_replies=get_replies,
-                           total_comments=len(story_comments))
+                           total_comments=len(story_comments),
+                           related=services.related_stories.get(story_id))
 
 
-@app.route('/submit', methods=['GET', 'POST'])
+@bp.route('/submit', methods=['GET', 'POST'])
 @login_required
 def submit_story():
+    mode = current_app.config['NEAR_DUP_MODE']
     if request.method == 'GET':
+        if mode != 'off' and not near_dup_index_ready():
+            # Build it while the form is being filled in, not on the POST.
+            services.cache_tasks.enqueue('warm_caches', key='warm_caches')
         return render_template('submit.html')
 
     # POST - handle form submission
@@ -308,76 +928,259 @@ def submit_story():
         'created_at': datetime.utcnow().isoformat() + 'Z'
     }
 
-    stories = load_stories()
-    stories.append(new_story)
-    save_stories(stories)
+    # A cold index takes seconds to build, so the check then runs after the
+    # save, in the background, and can only flag the story.
+    check_later = mode != 'off' and not near_dup_index_ready()
+    match = None if mode == 'off' or check_later else get_near_dup_index().find(new_story)
+    if match:
+        original_id, score = match
+        services.metrics.inc('near_duplicates_total', (('action', mode),))
+        if mode == 'merge':
+            flash('This story matches one already posted, so here it is.', 'success')
+            return redirect(url_for('main.story_detail', story_id=original_id))
+        new_story['duplicate_of'] = original_id
+        new_story['duplicate_score'] = round(score, 2)
+
+    with storage_lock():
+        stories = load_stories()
+        stories.append(new_story)
+        save_stories(stories)
+        publish_change('story', 'create', [new_story])
+    services.cache_tasks.enqueue('warm_caches', key='warm_caches')
+    services.cache_tasks.enqueue('refresh_related', key='refresh_related')
+    if check_later:
+        services.task_queue.enqueue('check_near_duplicate', new_story['id'])
 
-    return redirect(url_for('story_detail', story_id=new_story['id']))
+    return redirect(url_for('main.story_detail', story_id=new_story['id']))
 
 
-@app.route('/api/vote', methods=['POST'])
+@bp.route('/api/vote', methods=['POST'])
 def vote():
     data = request.get_json()
     item_type = data.get('type', 'story')  # 'story' or 'comment'
     item_id = data.get('id')
     direction = data.get('direction', 'up')
+    if not item_id:
+        return jsonify({'success': False}), 404
+
+    kind = 'story' if item_type == 'story' else 'comment'
+    user_id = current_user.id if current_user.is_authenticated else None
+    voter = voter_hash(user_id, request.remote_addr)
+    if services.vote_dedup.seen(kind, item_id, voter):
+        services.metrics.inc('votes_rejected_total', (('type', kind),))
+        return jsonify(DUPLICATE_VOTE), 409
+
+    status, votes = apply_votes([(kind, item_id, direction, voter)])[0]
+    if status == 'ok':
+        return jsonify({'success': True, 'votes': votes})
+    if status == 'duplicate':
+        return jsonify(DUPLICATE_VOTE), 409
+    return jsonify({'success': False}), 404
 
-    if item_type == 'story':
-        stories = load_stories()
-        for s in stories:
-            if s['id'] == item_id:
-                if direction == 'up':
-                    s['votes'] = s.get('votes', 0) + 1
-                else:
-                    s['votes'] = max(0, s.get('votes', 0) - 1)
-                save_stories(stories)
-                return jsonify({'success': True, 'votes': s['votes']})
-    else:
-        comments = load_comments()
-        for c in comments:
-            if c['id'] == item_id:
-                if direction == 'up':
-                    c['votes'] = c.get('votes', 0) + 1
-                else:
-                    c['votes'] = max(0, c.get('votes', 0) - 1)
-                save_comments(comments)
-                return jsonify({'success': True, 'votes': c['votes']})
 
-    return jsonify({'success': False}), 404
+@bp.route('/api/vote/batch', methods=['POST'])
+def vote_batch():
+    """Apply many votes in one storage transaction."""
+    user_id = current_user.id if current_user.is_authenticated else None
+    votes = parse_vote_batch(request.get_json(silent=True), voter_hash(user_id, request.remote_addr))
+    if votes is None:
+        return jsonify(BAD_VOTE_BATCH), 400
+    return jsonify(vote_batch_response(votes, apply_votes(votes)))
 
 
-@app.route('/api/comment', methods=['POST'])
+@bp.route('/api/comment', methods=['POST'])
 def add_comment():
-    data = request.get_json()
-    story_id = data.get('story_id')
-    author = data.get('author', 'Anonymous')
-    text = data.get('text', '').strip()
-    parent_id = data.get('parent_id')
-
-    if not text or not story_id:
+    new_comment = build_comment(request.get_json())
+    if new_comment is None:
         return jsonify({'success': False, 'error': 'Missing required fields'}), 400
+    add_comments([new_comment])
+    return jsonify({'success': True, 'comment': new_comment})
 
-    new_comment = {
-        'id': 'c' + str(uuid.uuid4())[:7],
-        'story_id': story_id,
-        'author': author or 'Anonymous',
-        'text': text,
-        'parent_id': parent_id,
-        'votes': 0,
-        'created_at': datetime.utcnow().isoformat() + 'Z'
-    }
 
-    comments = load_comments()
-    comments.append(new_comment)
-    save_comments(comments)
+@bp.route('/api/live')
+def live():
+    """Server-Sent Events with vote and comment counts for ?stories=id,id,...
+
+    Each open stream holds a worker under sync gunicorn, so this is only
+    served with LIVE_UPDATES=stream and an async worker class; `uvicorn
+    asgi:app` serves it on the event loop instead.
+    """
+    if not current_app.config['LIVE_STREAMING']:
+        abort(404)
+    stories = parse_stories(request.args.get('stories'))
+    if not stories:
+        return jsonify({'success': False, 'error': 'No stories to watch'}), 400
+    return Response(services.live_updates.stream(stories, request.headers.get('Last-Event-ID')),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/api/counts')
+def live_counts():
+    """Current vote and comment counts for ?stories=id,id,..., for pages that poll."""
+    stories = parse_stories(request.args.get('stories'))
+    if not stories:
+        return jsonify({'success': False, 'error': 'No stories to watch'}), 400
+    get_stories()
+    counts = {}
+    for story_id in stories:
+        record = services.story_store.get(story_id)
+        if record is not None:
+            counts[story_id] = {'votes': record.votes, 'comment_count': record.comment_count}
+    response = jsonify(counts)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def cacheable_response(mimetype, etag, last_modified, max_age):
+    """A public response with validators; already a 304 if the client's copy is current."""
+    response = Response(mimetype=mimetype)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if request.if_none_match.contains(etag) or (
+            not request.if_none_match and request.if_modified_since and last_modified
+            and request.if_modified_since >= last_modified.replace(microsecond=0)):
+        response.status_code = 304
+    return response
+
+
+@bp.route('/feed.xml')
+@bp.route('/feed/platform/<platform>.xml')
+@bp.route('/feed/tag/<tag>.xml')
+def feed(platform=None, tag=None):
+    """Atom feed of the newest stories, overall or for one platform or tag."""
+    get_analytics()  # syncs story_columns, whose codebooks list the known values
+    if (platform and platform not in services.story_columns.platforms.codes) or \
+            (tag and tag not in services.story_columns.tags.codes):
+        abort(404)
+    selected = get_feed(platform, tag)
+    response = cacheable_response('application/atom+xml', selected.etag, selected.updated, 300)
+    if response.status_code == 304:
+        return response
+    title = 'YC Postmortem' + (' · %s' % (platform or tag) if platform or tag else '')
+    response.response = atom_feed(selected, title, request.url, request.url_root)
+    return response
+
+
+@bp.route('/sitemap.xml')
+def sitemap_index():
+    """Sitemap index pointing at the story shards."""
+    maps = get_sitemaps()
+    response = cacheable_response('application/xml', maps.etag, parse_time(maps.lastmod), 600)
+    if response.status_code != 304:
+        shard_prefix = request.url_root + 'sitemaps/'
+        response.response = maps.index_xml(lambda n: '%s%d.xml' % (shard_prefix, n))
+    return response
+
+
+@bp.route('/sitemaps/<int:n>.xml')
+def sitemap_shard(n):
+    """Up to 50k story URLs; full shards never change, so they cache for a day."""
+    maps = get_sitemaps()
+    if n >= len(maps.shards):
+        abort(404)
+    shard = maps.shards[n]
+    full = shard.end - shard.start == maps.shard_size
+    response = cacheable_response('application/xml', shard.etag, parse_time(shard.lastmod),
+                                  86400 if full else 600)
+    if response.status_code != 304:
+        response.response = maps.shard_xml(n, request.url_root + 'story/')
+    return response
+
+
+@bp.route('/robots.txt')
+def robots():
+    return Response('User-agent: *\nAllow: /\nSitemap: %s\n' % url_for('main.sitemap_index', _external=True),
+                    mimetype='text/plain')
+
+
+@bp.route('/analytics')
+def analytics_page():
+    return render_template('analytics.html', analytics=get_analytics())
+
+
+@bp.route('/api/analytics')
+def analytics_api():
+    return jsonify(get_analytics())
+
+
+@bp.route('/api/suggest')
+def suggest():
+    q = request.args.get('q', '')
+    return jsonify({'suggestions': get_suggest_index().suggest(q)})
 
-    return jsonify({'success': True, 'comment': new_comment})
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    expected = current_app.config['METRICS_TOKEN']
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if not (is_admin() or (expected and scheme.lower() == 'bearer'
+                           and hmac.compare_digest(token.encode(), expected.encode()))):
+        abort(404)
+    return services.metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(e):
     return render_template('404.html'), 404
 
 
+@bp.cli.command('dedupe')
+@click.option('--apply', 'action', type=click.Choice(['report', 'flag', 'merge']), default='report',
+              help='report only, flag duplicates, or merge them into the original')
+@click.option('--threshold', type=float, default=NEAR_DUP_THRESHOLD)
+def dedupe(action, threshold):
+    """Find near-duplicate stories in the existing data."""
+    with storage_lock():
+        stories = load_stories()
+        duplicates = find_duplicates(stories, threshold)
+        for dup_id, (original_id, score) in duplicates.items():
+            print('%s -> %s (%.2f)' % (dup_id, original_id, score))
+        print('%d near-duplicates among %d stories' % (len(duplicates), len(stories)))
+        if action == 'report' or not duplicates:
+            return
+        by_id = {story['id']: story for story in stories}
+        if action == 'flag':
+            for dup_id, (original_id, score) in duplicates.items():
+                by_id[dup_id]['duplicate_of'] = original_id
+                by_id[dup_id]['duplicate_score'] = round(score, 2)
+        else:
+            # The original keeps the duplicates' votes and comments.
+            for dup_id, (original_id, _) in duplicates.items():
+                by_id[original_id]['votes'] = by_id[original_id].get('votes', 0) + by_id[dup_id].get('votes', 0)
+            stories = [story for story in stories if story['id'] not in duplicates]
+            comments = load_comments()
+            for comment in comments:
+                if comment.get('story_id') in duplicates:
+                    comment['story_id'] = duplicates[comment['story_id']][0]
+            save_comments(comments)
+            count_comments(stories, comments)
+        save_stories(stories)
+        services.change_feed.publish('story', 'rewrite', list(duplicates))
+
+
+@bp.cli.command('recount-comments')
+def recount_comments():
+    """Rebuild every story's comment_count and last_activity_at from the comments."""
+    with storage_lock():
+        stories = load_stories()
+        count_comments(stories, load_comments())
+        save_stories(stories)
+        services.change_feed.publish('story', 'rewrite', [story['id'] for story in stories])
+    print('Recounted comments on %d stories' % len(stories))
+
+
+@bp.cli.command('compile-templates')
+def compile_templates():
+    """Compile every template into the bytecode cache (run at build time)."""
+    for name in current_app.jinja_env.list_templates():
+        current_app.jinja_env.get_template(name)
+    print('Compiled templates into %s' % current_app.config['JINJA_CACHE_DIR'])
+
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,403 @@
+"""ASGI entry point with async handlers for the JSON write endpoints.
+
+    uvicorn asgi:app --workers 2
+
+``POST /api/vote``, ``/api/vote/batch`` and ``/api/comment`` are served on
+the event loop. Each request only parses its body and waits on a future. A
+single writer thread applies everything queued since its last pass as one
+batch, with one load and save of the JSON file, so thousands of open
+requests cost one coroutine each rather than one worker each. Every other route is handed to
+the Flask app on a thread pool. On shutdown, queued writes and background
+tasks are drained before the server exits.
+
+``GET /api/live`` (Server-Sent Events) is served on the loop as well. Each
+open stream is one coroutine, and all of them are woken together once per
+live batch.
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from itsdangerous import BadSignature
+
+from app import (app as flask_app, voter_hash, apply_votes, build_comment, add_comments,
+                 parse_vote_batch, vote_batch_response, in_app_context, DUPLICATE_VOTE, BAD_VOTE_BATCH)
+from live import HEARTBEAT, parse_stories
+
+# Streams are served on the event loop below, so pages can hold them open.
+flask_app.config['LIVE_STREAMING'] = True
+services = flask_app.extensions['services']
+# The app's helpers find its services through the app context.
+voter_hash = in_app_context(flask_app, voter_hash)
+vote_batch_response = in_app_context(flask_app, vote_batch_response)
+
+log = logging.getLogger(__name__)
+
+FLASK_THREADS = int(os.environ.get('ASGI_FLASK_THREADS', 8))
+MAX_BATCH = 500
+PROXY_COUNT = int(os.environ.get('PROXY_COUNT') or 0)
+
+
+class WriteBatcher:
+    """Queues writes from coroutines and applies them in batches off the loop.
+
+    Items submitted together form a group that is never split across
+    passes, so a group is applied in one call (one lock, one save).
+    """
+
+    def __init__(self, apply, executor):
+        self.apply = apply
+        self.executor = executor
+        self._pending = []  # (items, future) groups
+        self._task = None
+
+    async def submit(self, item):
+        return (await self.submit_group([item]))[0]
+
+    async def submit_group(self, items):
+        """Apply the items in the same pass; their results, in order."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((items, future))
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return await future
+
+    def _next_batch(self):
+        """Whole groups from the front of the queue, up to MAX_BATCH items (at least one group)."""
+        count = 0
+        for i, (items, _) in enumerate(self._pending):
+            if i and count + len(items) > MAX_BATCH:
+                break
+            count += len(items)
+        else:
+            i = len(self._pending)
+        batch, self._pending = self._pending[:i], self._pending[i:]
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                batch = self._next_batch()
+                try:
+                    results = await loop.run_in_executor(self.executor, self.apply,
+                                                         [item for items, _ in batch for item in items])
+                except Exception as exc:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(exc)
+                    continue
+                start = 0
+                for items, future in batch:
+                    if not future.done():
+                        future.set_result(results[start:start + len(items)])
+                    start += len(items)
+        finally:
+            self._task = None
+
+    async def drain(self):
+        while self._task is not None:
+            await self._task
+
+
+def _apply_comments(comments):
+    add_comments(comments)
+    return comments
+
+
+# One writer thread, so batches never interleave their load/save cycles.
+_writer = ThreadPoolExecutor(1, thread_name_prefix='asgi-writer')
+_flask_pool = ThreadPoolExecutor(FLASK_THREADS, thread_name_prefix='asgi-flask')
+votes = WriteBatcher(in_app_context(flask_app, apply_votes), _writer)
+comments = WriteBatcher(in_app_context(flask_app, _apply_comments), _writer)
+
+_sessions = flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+# ─── Request helpers ──────────────────────────────────────────────────────────
+
+def _headers(scope):
+    return {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def _client_addr(scope, headers):
+    """The client address, honouring X-Forwarded-For like ProxyFix does."""
+    forwarded = [a.strip() for a in headers.get('x-forwarded-for', '').split(',') if a.strip()]
+    if PROXY_COUNT and len(forwarded) >= PROXY_COUNT:
+        return forwarded[-PROXY_COUNT]
+    client = scope.get('client')
+    return client[0] if client else ''
+
+
+def _user_id(headers):
+    """The logged-in user id from the Flask session cookie, if any."""
+    if _sessions is None:
+        return None
+    morsel = SimpleCookie(headers.get('cookie', '')).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+    try:
+        session = _sessions.loads(morsel.value,
+                                  max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return session.get('_user_id')
+
+
+class InvalidBody(Exception):
+    """The request body is not a JSON object."""
+
+
+async def _read_json(receive):
+    body = await _read_body(receive)
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise InvalidBody()
+    if not isinstance(data, dict):
+        raise InvalidBody()
+    return data
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionResetError('client disconnected')
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode('ascii'))]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# ─── Async endpoints ──────────────────────────────────────────────────────────
+
+async def vote(scope, receive):
+    data = await _read_json(receive)
+    item_type = data.get('type', 'story')
+    item_id = data.get('id')
+    direction = data.get('direction', 'up')
+    if not item_id or not isinstance(item_id, str):
+        return 404, {'success': False}
+
+    kind = 'story' if item_type == 'story' else 'comment'
+    headers = _headers(scope)
+    voter = voter_hash(_user_id(headers), _client_addr(scope, headers))
+    if services.vote_dedup.seen(kind, item_id, voter):
+        services.metrics.inc('votes_rejected_total', (('type', kind),))
+        return 409, DUPLICATE_VOTE
+
+    status, count = await votes.submit((kind, item_id, direction, voter))
+    if status == 'ok':
+        return 200, {'success': True, 'votes': count}
+    if status == 'duplicate':
+        return 409, DUPLICATE_VOTE
+    return 404, {'success': False}
+
+
+async def vote_batch(scope, receive):
+    data = await _read_json(receive)
+    headers = _headers(scope)
+    batch = parse_vote_batch(data, voter_hash(_user_id(headers), _client_addr(scope, headers)))
+    if batch is None:
+        return 400, BAD_VOTE_BATCH
+    # One group, so the writer applies them under one lock with one save.
+    results = await votes.submit_group(batch)
+    return 200, vote_batch_response(batch, results)
+
+
+async def add_comment(scope, receive):
+    new_comment = build_comment(await _read_json(receive))
+    if new_comment is None:
+        return 400, {'success': False, 'error': 'Missing required fields'}
+    await comments.submit(new_comment)
+    return 200, {'success': True, 'comment': new_comment}
+
+
+class LiveWakeups:
+    """One asyncio.Event per live batch, set from the hub thread."""
+
+    def __init__(self):
+        self.loop = None
+        self.event = None
+
+    def current(self):
+        if self.loop is None:
+            self.loop, self.event = asyncio.get_running_loop(), asyncio.Event()
+            services.live_updates.add_listener(lambda: self.loop.call_soon_threadsafe(self._wake))
+        return self.event
+
+    def _wake(self):
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+_live_wakeups = LiveWakeups()
+
+
+async def _disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def live(scope, receive, send):
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    stories = parse_stories(query.get('stories', [''])[0])
+    if not stories:
+        return await _send_json(send, 400, {'success': False, 'error': 'No stories to watch'})
+    seq = services.live_updates.resume_from(_headers(scope).get('last-event-id'))
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')]})
+    await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+    services.live_updates.connect()
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    try:
+        while True:
+            # Take the event before reading, so a batch landing in between still wakes us.
+            wakeup = asyncio.ensure_future(_live_wakeups.current().wait())
+            seq, events = services.live_updates.events_since(seq, stories)
+            if events:
+                await send({'type': 'http.response.body', 'body': events.encode('utf-8'), 'more_body': True})
+            done, _ = await asyncio.wait({wakeup, disconnected}, timeout=HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            wakeup.cancel()
+            if disconnected in done:
+                return
+            if not done:
+                await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+    finally:
+        disconnected.cancel()
+        services.live_updates.disconnect()
+
+
+STREAMS = {
+    ('GET', '/api/live'): live,
+}
+
+ROUTES = {
+    ('POST', '/api/vote'): vote,
+    ('POST', '/api/vote/batch'): vote_batch,
+    ('POST', '/api/comment'): add_comment,
+}
+
+
+# ─── Flask fallback ───────────────────────────────────────────────────────────
+
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def call_flask(scope, receive, send):
+    """Run the WSGI app on the thread pool, streaming its body chunk by chunk."""
+    environ = _environ(scope, await _read_body(receive))
+    loop = asyncio.get_running_loop()
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+
+    result = await loop.run_in_executor(_flask_pool, flask_app, environ, start_response)
+    chunks = iter(result)
+    try:
+        chunk = await loop.run_in_executor(_flask_pool, next, chunks, None)
+        status, headers = started
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        while chunk is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(_flask_pool, next, chunks, None)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(_flask_pool, result.close)
+
+
+# ─── Application ──────────────────────────────────────────────────────────────
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await votes.drain()
+            await comments.drain()
+            await asyncio.get_running_loop().run_in_executor(None, services.task_queue.shutdown)
+            services.metrics.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    if scope['type'] != 'http':
+        return
+    stream = STREAMS.get((scope['method'], scope['path']))
+    if stream is not None:
+        return await stream(scope, receive, send)
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        return await call_flask(scope, receive, send)
+
+    started = time.perf_counter()
+    try:
+        status, payload = await handler(scope, receive)
+    except InvalidBody:
+        status, payload = 400, {'success': False, 'error': 'Invalid JSON body'}
+    except ConnectionResetError:
+        return  # the client went away before sending its whole body
+    except Exception:
+        log.exception('Unhandled error in %s %s', scope['method'], scope['path'])
+        status, payload = 500, {'success': False, 'error': 'Internal server error'}
+    await _send_json(send, status, payload)
+    # Labelled like the Flask view for the same route.
+    services.metrics.observe('http_request_duration_seconds',
+                             (('endpoint', 'main.' + handler.__name__), ('method', scope['method'])),
+                             time.perf_counter() - started)
+    services.metrics.maybe_flush()
@@ -0,0 +1,195 @@
+"""Concurrent vote/comment load against the sync and async serving modes.
+
+Runs the same workload twice on a fresh synthetic dataset: once against
+gunicorn's sync workers (the deployed ``gunicorn app:app``) and once against
+``uvicorn asgi:app`` with the same number of processes. The load comes from
+many concurrent keep-alive connections driven by one asyncio client. Every
+vote carries a distinct X-Forwarded-For address so that none of them is
+rejected as a duplicate.
+
+Usage:
+    python -m benchmarks.bench_async --size 1000 --concurrency 500 --workers 2
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from benchmarks.bench_routes import ROOT, RESULTS_DIR, summarize, git_commit, _free_port
+
+MODES = {
+    'sync': ['gunicorn', 'app:app', '--bind', '127.0.0.1:{port}', '--workers', '{workers}',
+             '--backlog', '4096'],
+    'async': ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}',
+              '--workers', '{workers}', '--backlog', '4096', '--log-level', 'warning'],
+}
+
+
+def start_server(mode, data_dir, port, workers):
+    env = dict(os.environ, DATA_DIR=data_dir, PROXY_COUNT='1', SECRET_KEY='bench')
+    cmd = [part.format(port=port, workers=workers) for part in MODES[mode]]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            asyncio.run(_request('127.0.0.1', port, 'GET', '/story/g0000000', None))
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    stop_server(proc)
+    raise RuntimeError('%s server did not start' % mode)
+
+
+def stop_server(proc):
+    os.killpg(proc.pid, signal.SIGTERM)
+    proc.wait(30)
+
+
+async def _request(host, port, method, path, body, headers=None):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return await _exchange(reader, writer, method, path, body, headers or {})
+    finally:
+        writer.close()
+
+
+async def _exchange(reader, writer, method, path, body, headers):
+    """Send one HTTP/1.1 request; return (status, keep_alive)."""
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+    lines = ['%s %s HTTP/1.1' % (method, path), 'Host: localhost',
+             'Content-Length: %d' % len(payload)]
+    if body is not None:
+        lines.append('Content-Type: application/json')
+    lines += ['%s: %s' % item for item in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    fields = {}
+    for line in header_lines:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            fields[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(fields.get('content-length', 0)))
+    return int(status_line.split()[1]), fields.get('connection', '').lower() != 'close'
+
+
+async def _connection(port, story_ids, deadline, seed, latencies, errors, accepted):
+    rng = random.Random(seed)
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            except OSError:
+                errors[0] += 1
+                await asyncio.sleep(0.05)
+                continue
+        story_id = rng.choice(story_ids)
+        headers = {'X-Forwarded-For': '10.%d.%d.%d' % (rng.randrange(256), rng.randrange(256),
+                                                        rng.randrange(256))}
+        if rng.random() < 0.8:
+            path, body = '/api/vote', {'type': 'story', 'id': story_id, 'direction': 'up'}
+        else:
+            path, body = '/api/comment', {'story_id': story_id, 'author': 'bench',
+                                          'text': 'Benchmark comment'}
+        t0 = time.perf_counter()
+        try:
+            status, keep_alive = await _exchange(reader, writer, 'POST', path, body, headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors[0] += 1
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - t0)
+        if status >= 400:
+            errors[0] += 1
+        elif path == '/api/vote':
+            accepted[0] += 1
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, story_ids, concurrency, seconds):
+    latencies, errors, accepted = [], [0], [0]
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(_connection(port, story_ids, deadline, i, latencies, errors, accepted)
+                           for i in range(concurrency)))
+    result = summarize(latencies, time.perf_counter() - started)
+    result['errors'] = errors[0]
+    result['votes_accepted'] = accepted[0]
+    return result
+
+
+def _stored_votes(data_dir):
+    with open(os.path.join(data_dir, 'stories.json'), encoding='utf-8') as f:
+        return sum(s.get('votes', 0) for s in json.load(f))
+
+
+def run_mode(mode, args):
+    data_dir = tempfile.mkdtemp(prefix='yc-bench-%s-' % mode)
+    sys.path.insert(0, ROOT)
+    from benchmarks.datasets import build_dataset
+    story_ids = build_dataset(data_dir, args.size, seed=args.seed)
+    votes_before = _stored_votes(data_dir)
+    port = _free_port()
+    proc = start_server(mode, data_dir, port, args.workers)
+    try:
+        result = asyncio.run(_load(port, story_ids, args.concurrency, args.seconds))
+    finally:
+        stop_server(proc)
+    # Equal to votes_accepted unless concurrent writers lost updates.
+    result['votes_stored'] = _stored_votes(data_dir) - votes_before
+    return result
+
+
+def main(args):
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': vars(args),
+        'modes': {},
+    }
+    print('%-8s %10s %10s %10s %8s %10s' % ('mode', 'req/s', 'p50 ms', 'p99 ms', 'errors',
+                                            'votes ok'))
+    for mode in args.modes:
+        r = report['modes'][mode] = run_mode(mode, args)
+        print('%-8s %10.1f %10.2f %10.2f %8d %4d/%-5d' % (
+            mode, r['throughput_rps'], r['p50_ms'], r['p99_ms'], r['errors'],
+            r['votes_stored'], r['votes_accepted']))
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.output or os.path.join(
+        RESULTS_DIR, 'async-%s-%s.json' % (report['timestamp'].replace(':', ''), report['commit']))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print('\nResults written to %s' % path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1000, help='stories in the dataset')
+    parser.add_argument('--concurrency', type=int, default=500, help='open client connections')
+    parser.add_argument('--workers', type=int, default=2, help='server processes per mode')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--modes', default='sync,async', type=lambda v: v.split(','))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/async-<time>-<commit>.json)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_args())
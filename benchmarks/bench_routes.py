@@ -0,0 +1,335 @@
+"""Route benchmarks for the Flask app at configurable dataset sizes.
+
+Each dataset size runs in its own process against a fresh data directory:
+first every route is driven in-process through Flask's test client, then a
+local server is put under load by several client processes. Throughput,
+p50/p99 latency and peak RSS are written to benchmarks/results/ as JSON so
+two commits can be compared.
+
+Usage:
+    python -m benchmarks.bench_routes --sizes 1000,10000
+    python -m benchmarks.bench_routes --sizes 100000 --load-processes 8 --load-seconds 20
+    python -m benchmarks.bench_routes --compare results/old.json results/new.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+SORTS = ('top', 'new', 'active', 'week', 'month', 'year')
+FILTERS = (
+    ('none', {}),
+    ('platform', {'platform': 'Y Combinator'}),
+    ('tag', {'tag': 'AI'}),
+    ('batch', {'batch': 'W2024'}),
+    ('platform+tag', {'platform': 'Y Combinator', 'tag': 'Solo Founder'}),
+    ('search', {'q': 'market'}),
+    ('search-typo', {'q': 'Paul Grahm'}),
+    ('tag+search', {'tag': 'Hardware', 'q': 'market'}),
+    ('page-5', {'page': '5'}),
+)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def summarize(latencies, elapsed):
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def peak_rss_kb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# ─── In-process (test client) scenarios ───────────────────────────────────────
+
+def scenarios(story_ids, rng):
+    """(name, callable(client)) pairs covering every benchmarked route."""
+    result = []
+    for sort in SORTS:
+        for fname, params in FILTERS:
+            query = dict(params, sort=sort)
+            result.append(('index[%s,%s]' % (sort, fname),
+                           lambda c, q=query: c.get('/', query_string=q)))
+    result.append(('story_detail', lambda c: c.get('/story/' + rng.choice(story_ids))))
+    # Votes come from a fresh client address each time; repeats are rejected.
+    result.append(('api_vote', lambda c: c.post('/api/vote', json={
+        'type': 'story', 'id': rng.choice(story_ids), 'direction': 'up'},
+        environ_base={'REMOTE_ADDR': '10.%d.%d.%d' % tuple(rng.randrange(256) for _ in range(3))})))
+    result.append(('api_vote_duplicate', lambda c: c.post('/api/vote', json={
+        'type': 'story', 'id': story_ids[0], 'direction': 'up'},
+        environ_base={'REMOTE_ADDR': '10.255.255.255'})))
+    result.append(('api_vote_batch', lambda c: c.post('/api/vote/batch', json={'votes': [
+        {'type': 'story', 'id': story_id, 'direction': 'up'} for story_id in rng.sample(story_ids, 10)]},
+        environ_base={'REMOTE_ADDR': '10.%d.%d.%d' % tuple(rng.randrange(256) for _ in range(3))})))
+    result.append(('api_comment', lambda c: c.post('/api/comment', json={
+        'story_id': rng.choice(story_ids), 'author': 'bench', 'text': 'Benchmark comment'})))
+    # A fresh client each time, so the login form is actually processed.
+    result.append(('login', lambda c: c.application.test_client().post('/login', data={
+        'username': 'bench', 'password': 'benchpass'})))
+    result.append(('submit', lambda c: c.post('/submit', data={
+        'title': 'Benchmark story', 'platform': 'Y Combinator', 'batch': 'W2025',
+        'tags': 'AI, Benchmark', 'rejection_reason': 'Benchmark', 'story': 'Body text. ' * 50,
+        'key_learning': 'Learning', 'advice_for_applicants': 'Advice'})))
+    return result
+
+
+def run_client_benchmarks(app_module, story_ids, iterations, time_budget):
+    rng = random.Random(1)
+    flask_app = app_module.app
+    flask_app.config['TESTING'] = True
+
+    client = flask_app.test_client()
+    client.post('/register', data={'username': 'bench', 'password': 'benchpass'})
+    authed = flask_app.test_client()
+    authed.post('/login', data={'username': 'bench', 'password': 'benchpass'})
+
+    results = {}
+    for name, call in scenarios(story_ids, rng):
+        c = authed if name == 'submit' else flask_app.test_client()
+        call(c)  # warm caches and templates
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            response = call(c)
+            latencies.append(time.perf_counter() - t0)
+            expected = 409 if name == 'api_vote_duplicate' else None
+            if response.status_code >= 400 and response.status_code != expected:
+                raise RuntimeError('%s returned %s' % (name, response.status_code))
+            if time.perf_counter() - started > time_budget:
+                break
+        results[name] = summarize(latencies, time.perf_counter() - started)
+    return results
+
+
+# ─── Multi-process load generator ─────────────────────────────────────────────
+
+def _serve(data_dir, port, ready):
+    os.environ['DATA_DIR'] = data_dir
+    sys.path.insert(0, ROOT)
+    import logging
+    from werkzeug.serving import make_server
+    import app as app_module
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, app_module.app, threaded=True)
+    ready.set()
+    server.serve_forever()
+
+
+def _load_worker(port, paths, seconds, seed, out):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        method, path, body = rng.choice(paths)
+        headers = {'Content-Type': 'application/json'} if body else {}
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400 and response.status != 409:  # 409: duplicate vote
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - t0)
+    out.put((latencies, errors))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _vm_hwm_kb(pid):
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_load(data_dir, story_ids, processes, seconds):
+    ctx = multiprocessing.get_context('spawn')
+    port = _free_port()
+    ready = ctx.Event()
+    server = ctx.Process(target=_serve, args=(data_dir, port, ready), daemon=True)
+    server.start()
+    ready.wait(120)
+
+    rng = random.Random(2)
+    sample = [rng.choice(story_ids) for _ in range(50)]
+    paths = [('GET', '/?sort=top', None), ('GET', '/?sort=new&tag=AI', None),
+             ('GET', '/?q=market', None)]
+    paths += [('GET', '/story/' + sid, None) for sid in sample[:10]]
+    paths += [('POST', '/api/vote', json.dumps({'type': 'story', 'id': sid, 'direction': 'up'}))
+              for sid in sample[10:20]]
+
+    out = ctx.Queue()
+    workers = [ctx.Process(target=_load_worker, args=(port, paths, seconds, i, out))
+               for i in range(processes)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    latencies, errors = [], 0
+    for _ in workers:
+        lat, err = out.get()
+        latencies.extend(lat)
+        errors += err
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, elapsed)
+    result.update({'processes': processes, 'errors': errors,
+                   'server_peak_rss_kb': _vm_hwm_kb(server.pid)})
+    server.terminate()
+    server.join()
+    return result
+
+
+# ─── Per-size driver ──────────────────────────────────────────────────────────
+
+def _run_size(size, args, out):
+    data_dir = tempfile.mkdtemp(prefix='yc-bench-%d-' % size)
+    os.environ['DATA_DIR'] = data_dir
+    sys.path.insert(0, ROOT)
+    from benchmarks.datasets import build_dataset
+
+    t0 = time.perf_counter()
+    story_ids = build_dataset(data_dir, size, seed=args.seed)
+    build_seconds = time.perf_counter() - t0
+
+    import app as app_module
+    result = {
+        'size': size,
+        'dataset_build_s': round(build_seconds, 3),
+        'routes': run_client_benchmarks(app_module, story_ids, args.iterations, args.route_seconds),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+    if args.load_processes:
+        result['load'] = run_load(data_dir, story_ids, args.load_processes, args.load_seconds)
+    out.put(result)
+
+
+def run(args):
+    ctx = multiprocessing.get_context('spawn')
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k != 'compare'},
+        'sizes': [],
+    }
+    for size in args.sizes:
+        out = ctx.Queue()
+        proc = ctx.Process(target=_run_size, args=(size, args, out))
+        proc.start()
+        result = out.get()
+        proc.join()
+        report['sizes'].append(result)
+        print_size(result)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.output or os.path.join(
+        RESULTS_DIR, '%s-%s.json' % (report['timestamp'].replace(':', ''), report['commit']))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print('\nResults written to %s' % path)
+
+
+def print_size(result):
+    print('\n== %d stories (peak RSS %.1f MB) ==' % (result['size'], result['peak_rss_kb'] / 1024))
+    print('%-32s %10s %10s %10s' % ('route', 'req/s', 'p50 ms', 'p99 ms'))
+    for name, r in result['routes'].items():
+        print('%-32s %10.1f %10.2f %10.2f' % (name, r['throughput_rps'], r['p50_ms'], r['p99_ms']))
+    if 'load' in result:
+        r = result['load']
+        print('%-32s %10.1f %10.2f %10.2f  (%d errors)' % (
+            'load[%d procs]' % r['processes'], r['throughput_rps'], r['p50_ms'], r['p99_ms'], r['errors']))
+
+
+def compare(old_path, new_path):
+    """Print per-route p50 and throughput deltas between two result files."""
+    with open(old_path, encoding='utf-8') as f:
+        old = {s['size']: s for s in json.load(f)['sizes']}
+    with open(new_path, encoding='utf-8') as f:
+        new = {s['size']: s for s in json.load(f)['sizes']}
+    for size in sorted(set(old) & set(new)):
+        print('\n== %d stories ==' % size)
+        print('%-32s %12s %12s %8s' % ('route', 'old p50 ms', 'new p50 ms', 'change'))
+        for name, r in new[size]['routes'].items():
+            before = old[size]['routes'].get(name)
+            if not before or not before['p50_ms']:
+                continue
+            change = (r['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+            print('%-32s %12.2f %12.2f %+7.1f%%' % (name, before['p50_ms'], r['p50_ms'], change))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000',
+                        type=lambda v: [int(x) for x in v.split(',') if x])
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='max requests per route in the test-client phase')
+    parser.add_argument('--route-seconds', type=float, default=5.0,
+                        help='time budget per route in the test-client phase')
+    parser.add_argument('--load-processes', type=int, default=4,
+                        help='client processes for the load phase (0 to skip)')
+    parser.add_argument('--load-seconds', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<time>-<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
@@ -0,0 +1,131 @@
+"""Load and save cost of the binary snapshots against the JSON data files.
+
+For each dataset size, a fresh corpus is written and the stories and
+comments files are each loaded both ways: ``json.load`` on the pretty-printed
+JSON (what ``load_json`` did before snapshots) and ``snapshot.read``. The
+benchmark records the median time of several loads, plus the peak and
+retained memory of one load under tracemalloc. The write cost of each format
+is measured the same way. Results go to benchmarks/results/ as JSON.
+
+Usage:
+    python -m benchmarks.bench_snapshot --sizes 1000,10000,100000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import tracemalloc
+
+from benchmarks.bench_routes import ROOT, RESULTS_DIR, git_commit
+
+FILES = ('stories.json', 'comments.json')
+
+
+def _timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return round(statistics.median(times) * 1000, 3)
+
+
+def _memory(fn):
+    """(peak, retained) KB allocated while fn runs, keeping its result alive."""
+    tracemalloc.start()
+    result = fn()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak // 1024, retained // 1024
+
+
+def bench_file(path, repeat):
+    import snapshot
+
+    def load_json():
+        with open(path, 'rb') as f:
+            return json.load(f)
+
+    data = load_json()
+    source = snapshot.stamp(os.stat(path))
+    snap = snapshot.path_for(path)
+    snapshot.write(snap, data, source)
+
+    def load_snapshot():
+        return snapshot.read(snap, source)
+
+    assert load_snapshot() == data
+    scratch = path + '.bench'
+
+    def save_json():
+        with open(scratch, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def save_snapshot():
+        snapshot.write(scratch, data, source)
+
+    result = {'records': len(data), 'json_bytes': os.path.getsize(path),
+              'snapshot_bytes': os.path.getsize(snap)}
+    for name, fn in (('json', load_json), ('snapshot', load_snapshot)):
+        result['%s_load_ms' % name] = _timed(fn, repeat)
+        result['%s_peak_kb' % name], result['%s_retained_kb' % name] = _memory(fn)
+    result['json_save_ms'] = _timed(save_json, max(1, repeat // 2))
+    result['snapshot_save_ms'] = _timed(save_snapshot, max(1, repeat // 2))
+    os.remove(scratch)
+    return result
+
+
+def run_size(size, args):
+    sys.path.insert(0, ROOT)
+    from benchmarks.datasets import build_dataset
+    data_dir = tempfile.mkdtemp(prefix='yc-bench-snap-')
+    try:
+        build_dataset(data_dir, size, seed=args.seed)
+        return {name: bench_file(os.path.join(data_dir, name), args.repeat) for name in FILES}
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(args):
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': vars(args),
+        'sizes': {},
+    }
+    print('%-8s %-14s %10s %10s %8s %10s %10s %10s %10s' % (
+        'size', 'file', 'json ms', 'snap ms', 'speedup', 'json MB', 'snap MB', 'json peak', 'snap peak'))
+    for size in args.sizes:
+        files = report['sizes'][size] = run_size(size, args)
+        for name, r in files.items():
+            print('%-8d %-14s %10.1f %10.1f %7.1fx %10.1f %10.1f %8dKB %8dKB' % (
+                size, name, r['json_load_ms'], r['snapshot_load_ms'],
+                r['json_load_ms'] / max(r['snapshot_load_ms'], 1e-6),
+                r['json_bytes'] / 1e6, r['snapshot_bytes'] / 1e6, r['json_peak_kb'], r['snapshot_peak_kb']))
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.output or os.path.join(
+        RESULTS_DIR, 'snapshot-%s-%s.json' % (report['timestamp'].replace(':', ''), report['commit']))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print('\nResults written to %s' % path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000', type=lambda v: [int(s) for s in v.split(',')])
+    parser.add_argument('--repeat', type=int, default=5, help='loads per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/snapshot-<time>-<commit>.json)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,129 @@
+"""Cold-start cost: importing the app and serving its first requests.
+
+Every run is a fresh interpreter, as on a new serverless instance. It
+records the time to import ``app``, the first ``GET /``, and the first
+``GET /story/<id>``, along with the wall time of the whole process. Runs
+alternate between an empty template bytecode cache and one filled by
+``flask compile-templates``, and the median of each is reported. Pass
+``--importtime`` to also print the slowest imports from ``python -X
+importtime``.
+
+Usage:
+    python -m benchmarks.bench_startup --size 1000 --runs 10
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess
+
+from benchmarks.bench_routes import ROOT, RESULTS_DIR, git_commit
+
+CHILD = '''
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+assert client.get('/').status_code == 200
+t2 = time.perf_counter()
+assert client.get('/story/g0000000').status_code == 200
+t3 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'first_index_ms': (t2 - t1) * 1000,
+                  'first_story_ms': (t3 - t2) * 1000, 'total_ms': (t3 - t0) * 1000}))
+'''
+
+
+def _env(data_dir, cache_dir):
+    return dict(os.environ, DATA_DIR=data_dir, JINJA_CACHE_DIR=cache_dir, SECRET_KEY='bench')
+
+
+def run_once(data_dir, cache_dir):
+    started = time.perf_counter()
+    out = subprocess.check_output([sys.executable, '-c', CHILD], cwd=ROOT, env=_env(data_dir, cache_dir))
+    result = json.loads(out.decode().strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def _median(runs):
+    return {key: round(statistics.median(r[key] for r in runs), 2) for key in runs[0]}
+
+
+def slowest_imports(data_dir, cache_dir, count=15):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                          env=_env(data_dir, cache_dir), stderr=subprocess.PIPE, check=True)
+    rows = []
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        # Only the modules app imports directly, so none is counted twice.
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main(args):
+    sys.path.insert(0, ROOT)
+    from benchmarks.datasets import build_dataset
+    data_dir = tempfile.mkdtemp(prefix='yc-bench-startup-')
+    cold_cache = tempfile.mkdtemp(prefix='yc-bench-jinja-cold-')
+    warm_cache = tempfile.mkdtemp(prefix='yc-bench-jinja-warm-')
+    try:
+        build_dataset(data_dir, args.size, seed=args.seed)
+        run_once(data_dir, warm_cache)  # seeds snapshots and other derived files
+        subprocess.check_call([sys.executable, '-m', 'flask', '--app', 'app', 'compile-templates'],
+                              cwd=ROOT, env=_env(data_dir, warm_cache), stdout=subprocess.DEVNULL)
+        runs = {'cold_templates': [], 'warm_templates': []}
+        for _ in range(args.runs):
+            shutil.rmtree(cold_cache)
+            os.makedirs(cold_cache)
+            runs['cold_templates'].append(run_once(data_dir, cold_cache))
+            runs['warm_templates'].append(run_once(data_dir, warm_cache))
+        report = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': vars(args),
+            'modes': {mode: _median(r) for mode, r in runs.items()},
+        }
+        print('%-16s %10s %12s %12s %10s %11s' % ('templates', 'import ms', 'first / ms',
+                                                  'first story', 'total ms', 'process ms'))
+        for mode, r in report['modes'].items():
+            print('%-16s %10.1f %12.1f %12.1f %10.1f %11.1f' % (
+                mode, r['import_ms'], r['first_index_ms'], r['first_story_ms'], r['total_ms'],
+                r['process_ms']))
+        if args.importtime:
+            print('\n%10s %10s  module' % ('cumul ms', 'self ms'))
+            for cumulative, own, name in slowest_imports(data_dir, warm_cache):
+                print('%10.1f %10.1f  %s' % (cumulative / 1000, own / 1000, name))
+    finally:
+        for path in (data_dir, cold_cache, warm_cache):
+            shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.output or os.path.join(
+        RESULTS_DIR, 'startup-%s-%s.json' % (report['timestamp'].replace(':', ''), report['commit']))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print('\nResults written to %s' % path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1000, help='stories in the dataset')
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes per mode')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/startup-<time>-<commit>.json)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_args())
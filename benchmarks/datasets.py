@@ -0,0 +1,8 @@
+"""Synthetic datasets for benchmarks, built with the seed_data generator."""
+from seed_data import write_corpus
+
+
+def build_dataset(data_dir, size, seed=0):
+    """Write `size` stories (and their comment threads) into data_dir."""
+    write_corpus(size, data_dir, seed)
+    return ['g%07d' % i for i in range(size)]
@@ -0,0 +1,275 @@
+"""Change feed that lets workers and replicas invalidate caches after writes.
+
+Every write publishes one entry, ``{seq, entity, op, ids, data}``, where
+``seq`` increases by one per entry across all writers. Each worker reads
+the entries it has not seen yet and updates only the entities they name.
+When a worker has missed entries (the log was rotated past it, or the feed
+server restarted), ``changes()`` returns None. The caller then reloads from
+the data files.
+
+Two implementations share that interface:
+
+* ``FileChangeFeed``: a JSON-lines log next to the data, for workers on one
+  host or replicas sharing a volume;
+* ``PubSubChangeFeed``: a client for a small TCP broker that assigns
+  sequence numbers and pushes entries to subscribers. The stand-in broker
+  is ``python changefeed.py --serve``; a hosted pub/sub would take its place.
+"""
+import os
+import json
+import time
+import fcntl
+import socket
+import logging
+import threading
+import socketserver
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+MAX_LOG_BYTES = 16 * 1024 * 1024
+BACKLOG = 10000  # entries the broker keeps for subscribers catching up
+RECONNECT_SECONDS = 1.0
+
+
+def _entry(seq, entity, op, ids, data):
+    return {'seq': seq, 'entity': entity, 'op': op, 'ids': list(ids), 'data': data}
+
+
+def _in_order(entries, seq):
+    """True if entries continue directly from seq."""
+    for entry in entries:
+        if entry['seq'] != seq + 1:
+            return False
+        seq = entry['seq']
+    return True
+
+
+class FileChangeFeed:
+    """Append-only JSON-lines log, rotated once it grows past max_bytes."""
+
+    def __init__(self, path, max_bytes=MAX_LOG_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.seq = 0
+        self._offset = 0
+        self._inode = None
+
+    def publish(self, entity, op, ids, data=None):
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(self.path, 'a+b') as f:
+                f.seek(0, os.SEEK_END)
+                seq = _last_seq(f, f.tell()) + 1
+                entry = _entry(seq, entity, op, ids, data)
+                line = json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+                if f.tell() and f.tell() + len(line) > self.max_bytes:
+                    # Readers notice the new inode and carry on from its first entry.
+                    tmp = '%s.%d.tmp' % (self.path, os.getpid())
+                    with open(tmp, 'wb') as new:
+                        new.write(line)
+                    os.replace(tmp, self.path)
+                else:
+                    f.write(line)
+        return seq
+
+    def seek_end(self):
+        """Skip everything published so far; call before loading the data files."""
+        try:
+            with open(self.path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                self.seq = _last_seq(f, st.st_size)
+        except FileNotFoundError:
+            self._inode, self._offset = None, 0
+            return
+        self._inode, self._offset = st.st_ino, st.st_size
+
+    def changes(self):
+        """Entries published since the last call, or None if some were missed."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        if st.st_ino != self._inode:
+            self._inode, self._offset = st.st_ino, 0
+        if st.st_size == self._offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+        chunk = chunk[:chunk.rfind(b'\n') + 1]  # only whole lines
+        self._offset += len(chunk)
+        entries = [json.loads(line) for line in chunk.splitlines() if line]
+        in_order = _in_order(entries, self.seq)
+        if entries:
+            self.seq = entries[-1]['seq']
+        return entries if in_order else None
+
+
+def _last_seq(f, size):
+    """Sequence number of the last complete line before `size`, or 0."""
+    end = size
+    tail = b''
+    while end > 0:
+        start = max(0, end - 4096)
+        f.seek(start)
+        tail = f.read(end - start) + tail
+        end = start
+        lines = tail.rstrip(b'\n').rsplit(b'\n', 1)
+        if len(lines) == 2 or end == 0:
+            last = lines[-1]
+            return json.loads(last)['seq'] if last else 0
+    return 0
+
+
+class PubSubChangeFeed:
+    """Client of the feed broker: publishes over one connection, subscribes on another."""
+
+    def __init__(self, address):
+        host, _, port = address.rpartition(':')
+        self.address = (host or '127.0.0.1', int(port))
+        self.seq = 0
+        self._lock = threading.Lock()
+        self._received = deque()
+        self._position = None  # broker seq this subscription has caught up to
+        self._missed = False
+        self._ready = threading.Event()
+        self._publish_lock = threading.Lock()
+        self._publisher = None
+        self._subscriber = None
+
+    def publish(self, entity, op, ids, data=None):
+        message = json.dumps({'publish': _entry(None, entity, op, ids, data)}, ensure_ascii=False)
+        with self._publish_lock:
+            for _ in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = socket.create_connection(self.address, timeout=5).makefile('rwb')
+                    self._publisher.write(message.encode('utf-8') + b'\n')
+                    self._publisher.flush()
+                    return json.loads(self._publisher.readline())['seq']
+                except (OSError, ValueError):
+                    self._publisher = None
+        # Peers will not hear about this write; at least this worker reloads.
+        log.error('Change feed unreachable at %s:%d', *self.address)
+        self._missed = True
+
+    def seek_end(self):
+        """Continue from the subscription's current position, dropping anything buffered."""
+        if self._subscriber is None:
+            self._subscriber = threading.Thread(target=self._listen, name='change-feed', daemon=True)
+            self._subscriber.start()
+            self._ready.wait(5)
+        with self._lock:
+            self._received.clear()
+            self._missed = False
+            self.seq = self._position or 0
+
+    def changes(self):
+        with self._lock:
+            if self._missed:
+                self._missed = False
+                return None
+            entries = list(self._received)
+            self._received.clear()
+        in_order = _in_order(entries, self.seq)
+        if entries:
+            self.seq = entries[-1]['seq']
+        return entries if in_order else None
+
+    def _listen(self):
+        while True:
+            try:
+                with socket.create_connection(self.address, timeout=5) as sock:
+                    sock.settimeout(None)
+                    stream = sock.makefile('rwb')
+                    stream.write(json.dumps({'subscribe': self._position}).encode('utf-8') + b'\n')
+                    stream.flush()
+                    for line in stream:
+                        message = json.loads(line)
+                        with self._lock:
+                            if 'head' in message:
+                                self._position = message['head']
+                            elif 'reset' in message:
+                                self._position = message['reset']
+                                self._missed = True
+                            else:
+                                self._position = message['seq']
+                                self._received.append(message)
+                        self._ready.set()
+            except (OSError, ValueError):
+                pass
+            # Reconnect from our position: the broker replays what we missed,
+            # or reports a reset if it no longer has it.
+            self._ready.set()
+            time.sleep(RECONNECT_SECONDS)
+
+
+# ─── Stand-in broker ──────────────────────────────────────────────────────────
+
+class ChangeFeedServer(socketserver.ThreadingTCPServer):
+    """Assigns sequence numbers and fans entries out to subscribers."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _BrokerHandler)
+        self.seq = 0
+        self.backlog = deque(maxlen=BACKLOG)
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def publish(self, entry):
+        with self.lock:
+            self.seq += 1
+            entry['seq'] = self.seq
+            self.backlog.append(entry)
+            line = json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+            for stream in list(self.subscribers):
+                try:
+                    stream.write(line)
+                    stream.flush()
+                except OSError:
+                    self.subscribers.discard(stream)
+            return self.seq
+
+    def subscribe(self, stream, since):
+        with self.lock:
+            if since is None:
+                stream.write(json.dumps({'head': self.seq}).encode('utf-8') + b'\n')
+            elif since > self.seq or (self.backlog and since < self.backlog[0]['seq'] - 1):
+                # Restarted broker or a subscriber that fell too far behind.
+                stream.write(json.dumps({'reset': self.seq}).encode('utf-8') + b'\n')
+            else:
+                for entry in self.backlog:
+                    if entry['seq'] > since:
+                        stream.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+            stream.flush()
+            self.subscribers.add(stream)
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            message = json.loads(line)
+            if 'publish' in message:
+                seq = self.server.publish(message['publish'])
+                self.wfile.write(json.dumps({'seq': seq}).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            elif 'subscribe' in message:
+                self.server.subscribe(self.wfile, message['subscribe'])
+        self.server.subscribers.discard(self.wfile)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Stand-in change feed broker')
+    parser.add_argument('--serve', action='store_true', required=True)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7070)
+    args = parser.parse_args()
+    server = ChangeFeedServer((args.host, args.port))
+    print('Change feed broker on %s:%d' % (args.host, args.port))
+    server.serve_forever()
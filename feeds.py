@@ -0,0 +1,73 @@
+"""Atom feeds of the newest stories: global, per platform and per tag.
+
+A feed is chosen once per data version (``select_feed``): the newest stories
+matching its filter, plus an ETag and Last-Modified derived from them. Any
+worker choosing the same stories produces the same validators, so a
+polling reader gets a 304 whichever worker answers. The XML is produced by
+a generator, one entry at a time, and nothing renders the whole document
+in memory.
+"""
+import hashlib
+import heapq
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+FEED_SIZE = 50
+SUMMARY_CHARS = 500
+
+
+class Feed:
+    __slots__ = ('entries', 'etag', 'updated')
+
+    def __init__(self, entries):
+        self.entries = entries
+        digest = hashlib.blake2b(digest_size=12)
+        for story in entries:
+            digest.update(('%s\0%s\n' % (story['id'], story.get('created_at', ''))).encode('utf-8'))
+        self.etag = digest.hexdigest()
+        self.updated = parse_time(entries[0].get('created_at')) if entries else None
+
+
+def select_feed(stories, platform=None, tag=None, size=FEED_SIZE):
+    """The newest `size` stories on a platform and/or with a tag, newest first."""
+    if platform:
+        stories = (s for s in stories if s.get('platform') == platform)
+    if tag:
+        stories = (s for s in stories if tag in s.get('tags', []))
+    return Feed(heapq.nlargest(size, stories, key=lambda s: s.get('created_at', '')))
+
+
+def parse_time(value):
+    """A stored created_at ('2024-05-01T12:00:00.123Z' or a bare date) as aware UTC."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.rstrip('Z'))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed
+
+
+def _time(value):
+    parsed = parse_time(value)
+    return (parsed or datetime(1970, 1, 1, tzinfo=timezone.utc)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def atom_feed(feed, title, feed_url, site_url):
+    """Yield the Atom document for a feed, entry by entry."""
+    yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+           '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+           '<title>%s</title>\n<id>%s</id>\n<link rel="self" href=%s/>\n<link href=%s/>\n<updated>%s</updated>\n'
+           % (escape(title), escape(feed_url), quoteattr(feed_url), quoteattr(site_url),
+              _time(feed.entries[0].get('created_at') if feed.entries else None)))
+    for story in feed.entries:
+        url = '%sstory/%s' % (site_url, story['id'])
+        summary = story.get('story') or ''
+        if len(summary) > SUMMARY_CHARS:
+            summary = summary[:SUMMARY_CHARS].rsplit(' ', 1)[0] + '…'
+        categories = ''.join('<category term=%s/>' % quoteattr(tag) for tag in story.get('tags', []))
+        yield ('<entry>\n<title>%s</title>\n<id>%s</id>\n<link href=%s/>\n<updated>%s</updated>\n'
+               '<author><name>%s</name></author>\n%s\n<summary>%s</summary>\n</entry>\n'
+               % (escape(story.get('title', '')), escape(url), quoteattr(url), _time(story.get('created_at')),
+                  escape(story.get('founder_name') or 'Anonymous'), categories, escape(summary)))
+    yield '</feed>\n'
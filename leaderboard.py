@@ -0,0 +1,243 @@
+"""Vote event log and time-windowed leaderboards.
+
+Every story vote is appended to a compact binary log (timestamp, delta, id).
+Each worker tails that log into per-story rollups: a ring buffer of daily
+counts for the last month and one of weekly counts for the last year.
+Windowed "top" queries are answered from running window totals kept on top
+of those rollups, never by replaying raw votes.
+
+Once COMPACT_BYTES of events have been folded in, the rollups are written to
+a snapshot next to the log and a fresh log is started (a new inode, as the
+change feed rotates), so startup reads the snapshot plus a short tail.
+"""
+import os
+import sys
+import fcntl
+import heapq
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+EVENT = struct.Struct('<Ib16s')  # unix seconds, vote delta, story id
+COMPACT_BYTES = 4 * 1024 * 1024
+COMPACT_MAGIC = b'YCROLLU1'
+COMPACT_HEADER = struct.Struct('<8sI')  # magic, story count
+ROLLUP = struct.Struct('<16sii')        # story id, day, week; then the daily and weekly rings
+
+DAILY_SLOTS = 32
+WEEKLY_SLOTS = 53
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+# Window name -> (bucket kind, bucket count). The year view is served from
+# 52 weekly buckets, so it spans 364-370 days depending on the weekday.
+WINDOWS = {
+    'week': ('daily', 7),
+    'month': ('daily', 30),
+    'year': ('weekly', 52),
+}
+
+
+def _day(ts):
+    return int(ts // 86400)
+
+
+class StoryRollup:
+    """Daily and weekly vote counts for one story, stored as ring buffers."""
+    __slots__ = ('daily', 'weekly', 'day', 'week')
+
+    def __init__(self):
+        self.daily = array('i', bytes(4 * DAILY_SLOTS))
+        self.weekly = array('i', bytes(4 * WEEKLY_SLOTS))
+        self.day = None
+        self.week = None
+
+    def add(self, day, delta):
+        week = day // 7
+        if self.day is None:
+            self.day, self.week = day, week
+        if day > self.day:
+            for d in range(self.day + 1, min(day, self.day + DAILY_SLOTS) + 1):
+                self.daily[d % DAILY_SLOTS] = 0
+            self.day = day
+        if week > self.week:
+            for w in range(self.week + 1, min(week, self.week + WEEKLY_SLOTS) + 1):
+                self.weekly[w % WEEKLY_SLOTS] = 0
+            self.week = week
+        if day > self.day - DAILY_SLOTS:
+            self.daily[day % DAILY_SLOTS] += delta
+        if week > self.week - WEEKLY_SLOTS:
+            self.weekly[week % WEEKLY_SLOTS] += delta
+
+    def total(self, window, today):
+        kind, span = WINDOWS[window]
+        if kind == 'daily':
+            ring, slots, head, now = self.daily, DAILY_SLOTS, self.day, today
+        else:
+            ring, slots, head, now = self.weekly, WEEKLY_SLOTS, self.week, today // 7
+        if head is None:
+            return 0
+        start = max(now - span + 1, head - slots + 1)
+        return sum(ring[b % slots] for b in range(start, head + 1))
+
+
+class VoteRollups:
+    """Per-worker windowed vote aggregates fed from the shared event log."""
+
+    def __init__(self, path, compact_bytes=COMPACT_BYTES):
+        self.path = path
+        self.compact_path = path + '.compact'
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._inode = None
+        self._offset = 0
+        self._rollups = {}
+        self._totals = {}
+        self._totals_day = None
+
+    def record(self, story_id, delta, ts=None):
+        """Append a vote event to the log and fold it into the rollups."""
+        ts = time.time() if ts is None else ts
+        with self._flock(fcntl.LOCK_SH), open(self.path, 'ab') as f:
+            f.write(EVENT.pack(int(ts), delta, story_id.encode('utf-8')))
+        self.refresh()
+
+    def refresh(self):
+        """Fold any events appended since the last call (by any worker)."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        if st.st_ino == self._inode and st.st_size == self._offset:
+            return
+        with self._lock:
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._reload()  # first load, or the log was compacted or replaced
+            else:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    self._offset += self._fold(f.read(st.st_size - self._offset))
+            if self._offset > self.compact_bytes:
+                self._compact()
+
+    def _fold(self, chunk):
+        """Fold whole events from chunk in; the number of bytes used."""
+        usable = len(chunk) - len(chunk) % EVENT.size
+        today = self._totals_day
+        for ts, delta, raw in EVENT.iter_unpack(chunk[:usable]):
+            story_id = raw.rstrip(b'\0').decode('utf-8')
+            rollup = self._rollups.get(story_id)
+            if rollup is None:
+                rollup = self._rollups[story_id] = StoryRollup()
+            day = _day(ts)
+            rollup.add(day, delta)
+            if today is not None and day == today:
+                for window, totals in self._totals.items():
+                    totals[story_id] = totals.get(story_id, 0) + delta
+            elif today is not None:
+                # Out-of-order or next-day event: recompute totals lazily.
+                self._totals_day = today = None
+        return usable
+
+    # ─── Compaction ───────────────────────────────────────────────────────
+    # Appends hold a shared flock and compaction an exclusive one, so no
+    # event lands in a log that is being replaced.
+
+    @contextmanager
+    def _flock(self, mode):
+        try:
+            lock = open(self.path + '.lock', 'a')
+        except OSError:
+            yield  # a read-only directory: nobody can be writing
+            return
+        with lock:
+            fcntl.flock(lock, mode)
+            yield
+
+    def _reload(self):
+        with self._flock(fcntl.LOCK_SH):
+            self._rollups, self._totals_day = {}, None
+            self._load_compacted()
+            with open(self.path, 'rb') as f:
+                self._inode = os.fstat(f.fileno()).st_ino
+                self._offset = self._fold(f.read())
+
+    def _load_compacted(self):
+        try:
+            with open(self.compact_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        if len(data) < COMPACT_HEADER.size:
+            return
+        magic, count = COMPACT_HEADER.unpack_from(data)
+        if magic != COMPACT_MAGIC:
+            return
+        pos, ring_bytes = COMPACT_HEADER.size, 4 * (DAILY_SLOTS + WEEKLY_SLOTS)
+        for _ in range(count):
+            raw, day, week = ROLLUP.unpack_from(data, pos)
+            pos += ROLLUP.size
+            rings = array('i')
+            rings.frombytes(data[pos:pos + ring_bytes])
+            pos += ring_bytes
+            if _BIG_ENDIAN:
+                rings.byteswap()
+            rollup = self._rollups[raw.rstrip(b'\0').decode('utf-8')] = StoryRollup()
+            rollup.day, rollup.week = day, week
+            rollup.daily, rollup.weekly = rings[:DAILY_SLOTS], rings[DAILY_SLOTS:]
+
+    def _compact(self):
+        try:
+            with self._flock(fcntl.LOCK_EX):
+                st = os.stat(self.path)
+                if st.st_ino != self._inode:
+                    return  # another worker compacted first; the next refresh reloads
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    self._offset += self._fold(f.read(st.st_size - self._offset))
+                rollups = [(sid, r) for sid, r in self._rollups.items() if r.day is not None]
+                parts = [COMPACT_HEADER.pack(COMPACT_MAGIC, len(rollups))]
+                for story_id, rollup in rollups:
+                    parts.append(ROLLUP.pack(story_id.encode('utf-8'), rollup.day, rollup.week))
+                    rings = rollup.daily + rollup.weekly
+                    if _BIG_ENDIAN:
+                        rings.byteswap()
+                    parts.append(rings.tobytes())
+                tmp = '%s.%d.tmp' % (self.compact_path, os.getpid())
+                with open(tmp, 'wb') as f:
+                    f.write(b''.join(parts))
+                os.replace(tmp, self.compact_path)
+                # Unlike voter records, events aren't idempotent: the fresh log
+                # must replace the old one before anyone reloads from the snapshot.
+                tmp = '%s.%d.tmp' % (self.path, os.getpid())
+                open(tmp, 'wb').close()
+                os.replace(tmp, self.path)
+                self._inode, self._offset = os.stat(self.path).st_ino, 0
+        except OSError:
+            pass  # e.g. read-only; the log keeps growing until it can be compacted
+
+    def _window(self, window, now):
+        """The cached totals for the window; call with the lock held."""
+        today = _day(time.time() if now is None else now)
+        if self._totals_day != today:
+            self._totals = {
+                w: {sid: r.total(w, today) for sid, r in self._rollups.items()}
+                for w in WINDOWS
+            }
+            self._totals_day = today
+        return self._totals[window]
+
+    def window_totals(self, window, now=None):
+        """Return {story_id: votes} for the window, as a copy of the cached totals."""
+        self.refresh()
+        with self._lock:
+            return dict(self._window(window, now))
+
+    def top(self, window, k=10, now=None):
+        """Return the k (story_id, votes) pairs with most votes in the window."""
+        self.refresh()
+        with self._lock:
+            totals = self._window(window, now)
+            return heapq.nlargest(k, ((sid, n) for sid, n in totals.items() if n > 0),
+                                  key=lambda x: x[1])
@@ -0,0 +1,154 @@
+"""Live vote and comment counts, pushed to readers over Server-Sent Events.
+
+Every worker already sees each write through the change feed. This hub
+collects the vote counts and new comments those entries carry. Every
+INTERVAL seconds it turns what has accumulated into one batch, so a burst
+of votes on a story becomes a single update. Each batch is encoded once
+per story. Sending it to a connection is then a string join over the
+stories that connection watches, however many connections there are.
+
+Event ids are ``<hub token>-<batch seq>``. A client reconnecting with
+Last-Event-ID to the same worker is sent the batches it missed, up to
+HISTORY of them. A client reconnecting to another worker starts from that
+worker's current batch.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+INTERVAL = 0.5
+HISTORY = 120       # batches kept for reconnecting clients: one minute
+HEARTBEAT = 15.0    # seconds between comments that keep idle connections open
+MAX_STORIES = 200   # stories one connection may watch
+
+
+class LiveUpdates:
+    """Coalesces count changes into batches and wakes the streams watching them."""
+
+    def __init__(self, refresh, interval=INTERVAL):
+        self.refresh = refresh  # pulls pending changes in, calling the record methods
+        self.interval = interval
+        self.token = os.urandom(4).hex()
+        self.seq = 0
+        self.connections = 0
+        self._pending = {}
+        self._batches = deque(maxlen=HISTORY)
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._thread = None
+
+    # ── Recording (called as changes are applied) ────────────────────────────
+
+    def _story(self, story_id):
+        return self._pending.setdefault(story_id, {})
+
+    def story_votes(self, story_id, votes):
+        if self.connections:
+            with self._cond:
+                self._story(story_id)['votes'] = votes
+
+    def comment_votes(self, story_id, comment_id, votes):
+        if self.connections:
+            with self._cond:
+                self._story(story_id).setdefault('comment_votes', {})[comment_id] = votes
+
+    def comment_added(self, story_id):
+        if self.connections:
+            with self._cond:
+                counts = self._story(story_id)
+                counts['comments'] = counts.get('comments', 0) + 1
+
+    # ── Batching ─────────────────────────────────────────────────────────────
+
+    def flush(self):
+        """Close the current batch and wake every stream; False if it was empty."""
+        with self._cond:
+            if not self._pending:
+                return False
+            self.seq += 1
+            encoded = {story_id: '%s:%s' % (json.dumps(story_id), json.dumps(counts, separators=(',', ':')))
+                       for story_id, counts in self._pending.items()}
+            self._batches.append((self.seq, encoded))
+            self._pending = {}
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+        return True
+
+    def add_listener(self, callback):
+        """Call callback() from the hub thread after every batch."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._cond:
+                if not self.connections:
+                    self._thread = None
+                    return
+            try:
+                self.refresh()
+            except Exception:
+                log.exception('Live update refresh failed')  # retried next tick
+            self.flush()
+
+    # ── Streams ──────────────────────────────────────────────────────────────
+
+    def connect(self):
+        with self._cond:
+            self.connections += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+                self._thread.start()
+
+    def disconnect(self):
+        with self._cond:
+            self.connections -= 1
+
+    def resume_from(self, last_event_id):
+        """The batch seq a (re)connecting stream continues after."""
+        token, _, seq = (last_event_id or '').partition('-')
+        if token == self.token and seq.isdigit() and int(seq) <= self.seq:
+            return int(seq)
+        return self.seq
+
+    def events_since(self, seq, stories):
+        """(latest seq, SSE text) for batches after seq touching the watched stories."""
+        with self._cond:
+            batches = [b for b in self._batches if b[0] > seq]
+            latest = self.seq
+        events = []
+        for batch_seq, encoded in batches:
+            parts = [encoded[s] for s in stories if s in encoded]
+            if parts:
+                events.append('id: %s-%d\nevent: counts\ndata: {%s}\n\n'
+                              % (self.token, batch_seq, ','.join(parts)))
+        return latest, ''.join(events)
+
+    def stream(self, stories, last_event_id=None):
+        """WSGI response body: SSE events for the watched stories, until disconnect."""
+        seq = self.resume_from(last_event_id)
+        self.connect()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                with self._cond:
+                    if self.seq == seq:
+                        self._cond.wait(HEARTBEAT)
+                seq, events = self.events_since(seq, stories)
+                yield events or ': keep-alive\n\n'
+        finally:
+            self.disconnect()
+
+
+def parse_stories(value):
+    """The story ids from a comma-separated query parameter, capped at MAX_STORIES."""
+    ids = [s for s in (value or '').split(',') if s]
+    return list(dict.fromkeys(ids))[:MAX_STORIES]
@@ -0,0 +1,212 @@
+"""Per-route latency histograms and counters, exposed in Prometheus format.
+
+Recording never takes a lock: each thread writes into its own shard, and
+shards are only merged when metrics are read. A thread's shard is folded
+into a base shard when the thread exits. Each worker process also
+dumps its merged view to a small JSON file every few seconds, and
+``/metrics`` adds up the files of every worker in the directory. Under
+gunicorn, any worker can answer a scrape for the whole pool. Files of
+workers that have exited are dropped as soon as a scrape notices.
+"""
+import os
+import json
+import time
+import weakref
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_SECONDS = 5.0
+STALE_SECONDS = 3600.0  # also ignore files not updated for this long (a reused pid)
+
+HELP = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint.'),
+    'phase_duration_seconds': ('histogram', 'Time spent per request phase (storage, filter/sort, render).'),
+    'votes_total': ('counter', 'Votes applied, by item type.'),
+    'votes_rejected_total': ('counter', 'Duplicate votes rejected, by item type.'),
+    'comments_total': ('counter', 'Comments created.'),
+    'cache_hits_total': ('counter', 'In-process cache hits, by cache.'),
+    'cache_misses_total': ('counter', 'In-process cache misses (rebuilds), by cache.'),
+    'near_duplicates_total': ('counter', 'Submissions matching an existing story, by action taken.'),
+    'snapshot_loads_total': ('counter', 'Data file loads, by file and whether a fresh snapshot was used.'),
+    'cache_reloads_total': ('counter', 'Full reloads from the data files (startup or missed changes).'),
+    'changes_applied_total': ('counter', 'Change feed entries applied to this worker, by entity and op.'),
+    'tasks_total': ('counter', 'Background tasks by name and outcome (queued, coalesced, inline, done, retried, failed).'),
+    'storage_bytes_written_total': ('counter', 'Bytes written by save_json, by file.'),
+}
+
+
+class Metrics:
+    """Lock-free per-thread recording with cross-process merge on read."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._local = threading.local()
+        self._base = {}  # counts of threads that have exited
+        self._shards = [self._base]
+        self._shards_lock = threading.Lock()
+        self._last_flush = 0.0
+
+    @property
+    def _path(self):
+        # Resolved per call: workers forked from a preloaded app share this object.
+        return os.path.join(self.directory, 'worker-%d.json' % os.getpid())
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # The owner lives in the thread's local storage, which is dropped
+            # when the thread exits; its finalizer then retires the shard.
+            owner = self._local.owner = _ShardOwner()
+            weakref.finalize(owner, self._retire, shard)
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._shards_lock:
+            for key, value in list(shard.items()):
+                _merge(self._base, key, value)
+            self._shards = [s for s in self._shards if s is not shard]
+
+    # ─── Recording ────────────────────────────────────────────────────────
+
+    def inc(self, name, labels=(), value=1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        shard = self._shard()
+        key = (name, labels)
+        hist = shard.get(key)
+        if hist is None:
+            hist = shard[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        hist[bisect_left(BUCKETS, seconds)] += 1
+        hist[-1] += seconds
+
+    @contextmanager
+    def timed(self, name, labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, labels, time.perf_counter() - t0)
+
+    # ─── Reading ──────────────────────────────────────────────────────────
+
+    def snapshot(self):
+        """Merge this process's thread shards into {(name, labels): value}."""
+        merged = {}
+        # Under the lock, so a retiring shard is never counted twice.
+        with self._shards_lock:
+            for shard in self._shards:
+                for key, value in list(shard.items()):
+                    _merge(merged, key, value)
+        return merged
+
+    def maybe_flush(self):
+        """Publish this worker's snapshot for its peers, at most every few seconds."""
+        now = time.time()
+        if now - self._last_flush < FLUSH_SECONDS:
+            return
+        self._last_flush = now
+        self.flush()
+
+    def flush(self):
+        data = [[name, [list(l) for l in labels], value]
+                for (name, labels), value in self.snapshot().items()]
+        path = self._path
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass  # e.g. a read-only filesystem: peers just won't see this worker
+
+    def collect(self):
+        """This worker's live numbers plus the last dump of every other worker."""
+        merged = self.snapshot()
+        own = self._path
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if (not entry.name.startswith('worker-') or not entry.name.endswith('.json')
+                    or entry.path == own):
+                continue
+            if not _alive(entry.name[len('worker-'):-len('.json')]):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            try:
+                if now - entry.stat().st_mtime > STALE_SECONDS:
+                    continue
+                with open(entry.path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in data:
+                _merge(merged, (name, tuple(tuple(l) for l in labels)), value)
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format."""
+        by_name = {}
+        for (name, labels), value in self.collect().items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text = HELP.get(name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in sorted(by_name[name]):
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ('+Inf',), value[:-1]):
+                        cumulative += count
+                        lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', str(bound)),)), cumulative))
+                    lines.append('%s_sum%s %.6f' % (name, _labels(labels), value[-1]))
+                    lines.append('%s_count%s %d' % (name, _labels(labels), cumulative))
+                else:
+                    lines.append('%s%s %s' % (name, _labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except OSError:
+        pass  # e.g. EPERM: it exists but belongs to someone else
+    return True
+
+
+class _ShardOwner:
+    __slots__ = ('__weakref__',)
+
+
+def _merge(merged, key, value):
+    current = merged.get(key)
+    if current is None:
+        merged[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            current[i] += v
+    else:
+        merged[key] = current + value
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in labels)
@@ -0,0 +1,184 @@
+"""Query plans for the story feed: filter by facets and search, keep one page.
+
+The feed filters on platform, tag, batch and a search query. Each facet
+value keeps a sorted list of story ordinals, so the length of that list is
+the exact number of stories it admits. The search index can only estimate:
+its bound is the posting count of the query's rarest term. A plan takes the
+predicates from most to least selective. The first one produces the
+candidates. Each later facet is intersected into them, by bisecting the
+longer list when it is much longer and by a hash lookup otherwise. A search
+that comes late only probes the surviving candidates in its postings.
+
+The ordering is a bounded heap that keeps the top k of the survivors, not
+a sort of every story. ``Plan.explain()`` lists each step with its
+estimated and actual row counts, like EXPLAIN ANALYZE.
+"""
+import heapq
+from array import array
+from bisect import bisect_left
+
+FACETS = ('platform', 'tag', 'batch')
+BISECT_RATIO = 16   # bisect into the longer list once it is this many times longer
+PROBE_RATIO = 16    # the same trade-off between probing search postings and a full search
+_EMPTY = array('I')
+
+
+def intersect(small, large):
+    """Ordinals in both sorted lists, in order, and the method used."""
+    if len(large) > len(small) * BISECT_RATIO:
+        result, lo, n = [], 0, len(large)
+        for o in small:
+            lo = bisect_left(large, o, lo)
+            if lo == n:
+                break
+            if large[lo] == o:
+                result.append(o)
+        return result, 'bisect'
+    members = set(large)
+    return [o for o in small if o in members], 'hash'
+
+
+class Plan:
+    """The steps one feed query ran, with estimated and actual row counts."""
+
+    def __init__(self, total):
+        self.total = total
+        self.steps = []
+
+    def step(self, operation, detail, estimate, rows):
+        self.steps.append((operation, detail, estimate, rows))
+
+    def explain(self):
+        lines = ['%d stories' % self.total]
+        for operation, detail, estimate, rows in self.steps:
+            lines.append('-> %-18s %-36s est=%-8s rows=%d'
+                         % (operation, detail, '-' if estimate is None else estimate, rows))
+        return '\n'.join(lines) + '\n'
+
+
+class SearchPredicate:
+    """A search query as a plan predicate, backed by a SearchIndex."""
+
+    def __init__(self, index, query, matched):
+        self.index = index
+        self.query = query
+        self.matched = matched
+        self.estimate = index.estimate(matched)
+        self.ranks = {}  # story id -> (tier, edits), for ordering the survivors
+
+    def run(self, within=None):
+        self.ranks = self.index.search(self.query, self.matched, within)
+        return self.ranks
+
+
+class QueryPlanner:
+    """Per-facet ordinal lists over the story list, synced as stories arrive."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.ordinals = {}
+        self.stories = []
+        self.postings = {facet: {} for facet in FACETS}
+
+    def sync(self, stories):
+        """Index appended stories; rebuild if the list was rewritten."""
+        n = len(self.ids)
+        if len(stories) < n or (n and stories[n - 1].get('id') != self.ids[-1]):
+            self._reset()
+            n = 0
+        self.stories = stories
+        for story in stories[n:]:
+            self.add(story)
+        return self
+
+    def add(self, story):
+        ordinal = self.ordinals[story['id']] = len(self.ids)
+        self.ids.append(story['id'])
+        self._post('platform', story.get('platform'), ordinal)
+        self._post('batch', story.get('batch'), ordinal)
+        for tag in dict.fromkeys(story.get('tags', [])):
+            self._post('tag', tag, ordinal)
+
+    def _post(self, facet, value, ordinal):
+        if value:
+            lists = self.postings[facet]
+            lst = lists.get(value)
+            if lst is None:
+                lst = lists[value] = array('I')
+            lst.append(ordinal)
+
+    def values(self, facet):
+        """Every value the facet has, unordered."""
+        return list(self.postings[facet])
+
+    def count(self, facet, value):
+        return len(self.postings[facet].get(value, _EMPTY))
+
+    def select(self, filters, key, k, search=None, scan=None):
+        """(matching count, top k stories by key descending, plan).
+
+        `filters` is a list of (facet, value) pairs, `search` an optional
+        SearchPredicate, and `scan` an optional story -> bool check for
+        queries the search index cannot answer. Search hits are ordered by
+        match quality first, then by key.
+        """
+        n = len(self.ids)
+        plan = Plan(n)
+        predicates = [(self.count(facet, value), facet, value) for facet, value in filters]
+        if search is not None:
+            predicates.append((search.estimate, 'search', search.query))
+        predicates.sort(key=lambda p: p[0])
+
+        candidates = None  # None means every story
+        for estimate, facet, value in predicates:
+            if candidates is not None and not candidates:
+                break
+            if facet == 'search':
+                candidates = self._search(search, candidates, plan)
+            elif candidates is None:
+                candidates = self.postings[facet].get(value, _EMPTY)
+                plan.step('scan', '%s=%s' % (facet, value), estimate, len(candidates))
+            else:
+                candidates, method = intersect(candidates, self.postings[facet].get(value, _EMPTY))
+                plan.step('intersect ' + method, '%s=%s' % (facet, value), estimate, len(candidates))
+        if candidates is None:
+            candidates = range(n)
+            plan.step('scan', 'all stories', n, n)
+
+        stories = self.stories
+        if scan is not None:
+            candidates = [o for o in candidates if scan(stories[o])]
+            plan.step('filter', 'substring match', None, len(candidates))
+
+        if search is not None:
+            ranks = search.ranks
+            sort_key = lambda o: _negated(ranks[self.ids[o]]) + (key(stories[o]),)
+        else:
+            sort_key = lambda o: key(stories[o])
+        top = heapq.nlargest(k, candidates, key=sort_key)
+        plan.step('top-k heap', 'k=%d' % k, min(k, len(candidates)), len(top))
+        return len(candidates), [stories[o] for o in top], plan
+
+    def _search(self, search, candidates, plan):
+        if candidates is not None and len(candidates) * PROBE_RATIO < search.estimate:
+            hits = search.run([self.ids[o] for o in candidates])
+            plan.step('probe search', repr(search.query), search.estimate, len(hits))
+            return [o for o in candidates if self.ids[o] in hits]
+        hits = search.run()
+        ordinals = sorted(self.ordinals[story_id] for story_id in hits if story_id in self.ordinals)
+        plan.step('search', repr(search.query), search.estimate, len(ordinals))
+        if candidates is None:
+            return ordinals
+        if len(candidates) > len(ordinals):
+            candidates, ordinals = ordinals, candidates
+        candidates, method = intersect(candidates, ordinals)
+        plan.step('intersect ' + method, 'search hits', len(ordinals), len(candidates))
+        return candidates
+
+
+def _negated(rank):
+    tier, edits = rank
+    return (-tier, -edits)
@@ -0,0 +1,134 @@
+"""Opt-in, per-request profiling.
+
+A request is profiled when an admin asks for it (``?_profile=1`` or an
+``X-Profile: 1`` header), or when it is picked by ``PROFILE_SAMPLE_RATE``.
+Asking for ``collapsed`` instead of ``1`` records flamegraph-compatible
+collapsed stacks with a stack sampler instead of cProfile output. Results
+are written to the profile directory, named after the endpoint plus a random
+suffix; query values never reach the filename.
+With sampling off and no flag present, the only per-request cost is a
+lookup in the query string and headers.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import threading
+from collections import Counter
+
+from flask import g, request
+
+SAMPLE_INTERVAL = 0.001
+
+
+class StackSampler:
+    """Samples one thread's Python stack into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.counts.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+
+class RequestProfiler:
+    """Flask extension that profiles selected requests to a directory."""
+
+    def __init__(self, app=None, directory=None, is_admin=None, sample_rate=0.0,
+                 sample_format='pstats'):
+        self.directory = directory
+        self.is_admin = is_admin or (lambda: False)
+        self.sample_rate = sample_rate
+        self.sample_format = sample_format
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    def _requested_format(self):
+        flag = request.args.get('_profile') or request.headers.get('X-Profile')
+        if flag:
+            if not self.is_admin():
+                return None
+            return 'collapsed' if flag == 'collapsed' else 'pstats'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.sample_format
+        return None
+
+    def _start(self):
+        if not (self.sample_rate or '_profile' in request.args or 'X-Profile' in request.headers):
+            return
+        fmt = self._requested_format()
+        if fmt == 'collapsed':
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        elif fmt == 'pstats':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            return
+        g.profiler = (fmt, profiler)
+
+    def _stop_and_save(self):
+        fmt, profiler = g.pop('profiler')
+        if fmt == 'collapsed':
+            profiler.stop()
+        else:
+            profiler.disable()
+        path = os.path.join(self.directory, self._filename(fmt))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if fmt == 'collapsed':
+                profiler.dump(path)
+            else:
+                profiler.dump_stats(path)
+        except OSError:
+            return None  # e.g. a read-only filesystem: the request itself still succeeds
+        return path
+
+    def _finish(self, response):
+        if 'profiler' in g:
+            path = self._stop_and_save()
+            if path:
+                response.headers['X-Profile-Saved'] = os.path.basename(path)
+        return response
+
+    def _teardown(self, exc):
+        # The request failed before after_request ran; keep the profile anyway.
+        if 'profiler' in g:
+            self._stop_and_save()
+
+    def _filename(self, fmt):
+        parts = [time.strftime('%Y%m%dT%H%M%S'), request.method,
+                 request.endpoint or 'unmatched', uuid.uuid4().hex[:12]]
+        return '_'.join(parts) + ('.collapsed' if fmt == 'collapsed' else '.prof')
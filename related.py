@@ -0,0 +1,238 @@
+"""Precomputed "related stories" via TF-IDF nearest neighbours.
+
+A background thread turns each story into a sparse, L2-normalised TF-IDF
+vector (title, story, key learning, rejection reason and tags) and scores
+candidate neighbours by walking an inverted index, so only stories that
+share a term are ever compared. New stories are folded in incrementally:
+they get their own top-k list and are pushed into existing lists where they
+beat the current k-th neighbour. The IDF weights are refreshed with a full
+rebuild once the corpus has grown by a quarter since the last one.
+
+The result is written to a JSON file mapping story id to its neighbours, so
+the detail page only ever does a dict lookup. A worker that starts while
+that file already covers every story serves it without building a model.
+If the file can't be written, the lists are served from memory and refresh
+requests are ignored for RETRY_SECONDS.
+"""
+import os
+import re
+import json
+import math
+import time
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset("""
+    a about after again all also an and any are as at be because been before
+    but by can could did do does don for from had has have he her his how i if
+    in into is it its just like me more most my no not now of on one only or
+    our out so some than that the their them then there they this to too up us
+    very was we were what when which who why will with would you your yc
+""".split())
+
+FIELD_WEIGHTS = (
+    ('title', 2.0),
+    ('rejection_reason', 2.0),
+    ('key_learning', 1.0),
+    ('story', 1.0),
+)
+TAG_WEIGHT = 3.0
+MAX_TERMS = 48           # strongest terms kept per story vector
+MAX_POSTINGS_RATIO = 0.2  # terms in more than this share of stories are skipped
+REBUILD_GROWTH = 1.25
+RETRY_SECONDS = 60       # quiet period after a failed save
+
+
+def story_terms(story):
+    """Weighted term counts for one story."""
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for tok in TOKEN_RE.findall((story.get(field) or '').lower()):
+            if len(tok) > 2 and tok not in STOPWORDS:
+                terms[tok] += weight
+    for tag in story.get('tags', []):
+        terms['tag:' + tag.lower()] += TAG_WEIGHT
+    return terms
+
+
+class RelatedStories:
+    """Maintains and serves the precomputed neighbour lists."""
+
+    def __init__(self, path, load_stories, k=5):
+        self.path = path
+        self.load_stories = load_stories  # the current story list (records or dicts)
+        self.k = k
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._lookup = {}
+        self._lookup_mtime = None
+        self._retry_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._ids = []
+        self._pos = {}
+        self._titles = []
+        self._vectors = []
+        self._postings = defaultdict(list)
+        self._df = Counter()
+        self._neighbours = []
+        self._built_n = 0
+
+    # ─── Serving ──────────────────────────────────────────────────────────
+
+    def get(self, story_id):
+        """Return [{'id', 'title'}] neighbours for a story (dict lookup).
+
+        A rewritten file is re-read by the background thread; until then
+        the previous lists are served.
+        """
+        lookup = self._lookup
+        if _mtime(self.path) != self._lookup_mtime or (story_id not in lookup
+                                                         and story_id not in self._pos):
+            self.request_refresh()
+        return lookup.get(story_id, [])
+
+    def _load(self):
+        """Swap in the file's lists if it changed, keeping the old ones if it can't be read."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._lookup_mtime:
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lookup = json.load(f)
+        except ValueError:
+            self._lookup_mtime = mtime  # retried once the file is rewritten
+            return
+        except OSError:
+            return
+        self._lookup, self._lookup_mtime = lookup, mtime
+
+    def request_refresh(self):
+        """Wake the background job; starts it on first use."""
+        if time.monotonic() < self._retry_at:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='related-stories', daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the previous lists; the next wake retries.
+                pass
+            self._load()
+
+    # ─── Building ─────────────────────────────────────────────────────────
+
+    def refresh(self):
+        """Fold new stories in, rebuilding from scratch when IDF has drifted."""
+        with self._lock:
+            stories = self.load_stories()
+            if not self._ids:
+                self._load()
+                if self._lookup and all(s['id'] in self._lookup for s in stories):
+                    return  # another worker's lists are current; build when stories arrive
+            ids = {s['id'] for s in stories}
+            new = [s for s in stories if s['id'] not in self._pos]
+            stale = any(i not in ids for i in self._ids)
+            if not new and not stale and os.path.exists(self.path):
+                return
+            if stale or not self._ids or len(stories) > self._built_n * REBUILD_GROWTH:
+                self._rebuild(stories)
+            else:
+                for s in new:
+                    self._add(s)
+            self._save()
+
+    def _idf(self, term):
+        return math.log((len(self._ids) + 1) / (self._df.get(term, 0) + 1)) + 1.0
+
+    def _vectorize(self, terms):
+        weights = {t: (1.0 + math.log(c)) * self._idf(t) for t, c in terms.items()}
+        top = heapq.nlargest(MAX_TERMS, weights.items(), key=lambda x: x[1])
+        norm = math.sqrt(sum(w * w for _, w in top)) or 1.0
+        return [(t, w / norm) for t, w in top]
+
+    def _append(self, story, terms):
+        i = len(self._ids)
+        self._ids.append(story['id'])
+        self._pos[story['id']] = i
+        self._titles.append(story.get('title', ''))
+        self._df.update(terms.keys())
+        return i
+
+    def _index(self, i, terms):
+        vector = self._vectorize(terms)
+        self._vectors.append(vector)
+        for term, weight in vector:
+            self._postings[term].append((i, weight))
+
+    def _scores(self, i):
+        """Cosine similarity of story i against every story sharing a term."""
+        limit = max(self.k * 4, int(len(self._ids) * MAX_POSTINGS_RATIO))
+        scores = defaultdict(float)
+        for term, weight in self._vectors[i]:
+            postings = self._postings[term]
+            if len(postings) > limit:
+                continue
+            for j, w in postings:
+                scores[j] += weight * w
+        scores.pop(i, None)
+        return scores
+
+    def _rebuild(self, stories):
+        self._reset()
+        all_terms = [story_terms(s) for s in stories]
+        for s, terms in zip(stories, all_terms):
+            self._append(s, terms)
+        for i, terms in enumerate(all_terms):
+            self._index(i, terms)
+        for i in range(len(self._ids)):
+            scores = self._scores(i)
+            self._neighbours.append(heapq.nlargest(self.k, ((sc, j) for j, sc in scores.items())))
+        self._built_n = len(self._ids)
+
+    def _add(self, story):
+        terms = story_terms(story)
+        i = self._append(story, terms)
+        self._index(i, terms)
+        scores = self._scores(i)
+        self._neighbours.append(heapq.nlargest(self.k, ((sc, j) for j, sc in scores.items())))
+        for j, sc in scores.items():
+            current = self._neighbours[j]
+            if len(current) < self.k or sc > current[-1][0]:
+                current.append((sc, i))
+                current.sort(reverse=True)
+                del current[self.k:]
+
+    def _save(self):
+        lookup = {
+            self._ids[i]: [{'id': self._ids[j], 'title': self._titles[j]} for _, j in nbrs]
+            for i, nbrs in enumerate(self._neighbours)
+        }
+        # Every worker refreshes on its own; each writes its own temp file.
+        tmp = '%s.%d.%d.tmp' % (self.path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(lookup, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            # Serve this worker's lists, and don't rebuild on every page view.
+            self._lookup, self._lookup_mtime = lookup, _mtime(self.path)
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
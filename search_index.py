@@ -0,0 +1,301 @@
+"""Inverted word index with a trigram index over the vocabulary.
+
+Every searchable field is tokenised into words; each word keeps a sorted
+posting list of story ordinals. The vocabulary itself is indexed by
+trigrams, which lets a query term be matched without scanning stories:
+
+* exact hits are vocabulary words that contain the term (the same substring
+  semantics the feed search always had), found by intersecting the term's
+  trigram lists;
+* fuzzy hits are words sharing enough padded trigrams with the term to be
+  within its edit budget, and only those candidates are verified with a
+  bounded Levenshtein distance.
+
+Next to each posting the index keeps where the word first occurs in the
+story body or key learning, as a byte offset into that field. A result
+snippet starts from those offsets: it reads only a window of the field and
+highlights the matched words in it, so nothing rescans a whole body.
+"""
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+SEARCH_FIELDS = ('title', 'story', 'key_learning', 'company_name', 'founder_name', 'platform')
+SNIPPET_FIELDS = ('story', 'key_learning')  # fields with positions, in order of preference
+SNIPPET_BYTES = 200
+SNIPPET_LEAD = 60   # bytes of context kept before the first match
+
+_BYTES_WORD_RE = re.compile(rb'[a-z0-9]+')
+_FIELD_SHIFT = 24   # a position is field << 24 | byte offset
+_OFFSET_MASK = (1 << _FIELD_SHIFT) - 1
+NO_POSITION = 0xFFFFFFFF
+
+EXACT, FUZZY = 0, 1
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def trigrams(word, padded=True):
+    w = '$' + word + '$' if padded else word
+    return {w[i:i + 3] for i in range(len(w) - 2)}
+
+
+def max_edits(term):
+    if len(term) <= 3:
+        return 0
+    return 1 if len(term) <= 6 else 2
+
+
+def first_positions(text, field):
+    """{word: position} of each word's first occurrence in a snippet field.
+
+    A position is field << 24 | the word's byte offset in the field's UTF-8.
+    """
+    if not text:
+        return {}
+    # bytes.lower() only folds ASCII, so offsets in it are offsets in the field.
+    matches = list(_BYTES_WORD_RE.finditer(text.encode('utf-8').lower()))
+    first = {m.group(): m.start() for m in reversed(matches)}
+    base = field << _FIELD_SHIFT
+    return {word.decode('ascii'): base | offset for word, offset in first.items() if offset <= _OFFSET_MASK}
+
+
+def highlighter(words):
+    """A pattern finding any of the given words as whole words, in any case."""
+    alternatives = '|'.join(sorted(words, key=len, reverse=True)) or '(?!)'
+    return re.compile(r'(?<![a-z0-9])(?:%s)(?![a-z0-9])' % alternatives, re.I | re.A)
+
+
+def highlight(text, pattern):
+    """Split text into (text, is_match) segments, marking the highlighter's words."""
+    segments = []
+    last = 0
+    for m in pattern.finditer(text):
+        if m.start() > last:
+            segments.append((text[last:m.start()], False))
+        segments.append((m.group(), True))
+        last = m.end()
+    if last < len(text):
+        segments.append((text[last:], False))
+    return segments
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class SearchIndex:
+    """Word postings plus vocabulary trigrams, synced from the story list."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.ordinals = {}
+        self.vocab = {}
+        self.words = []
+        self.postings = []
+        self.positions = []  # parallel to postings: first position in the story, or NO_POSITION
+        self.grams = {}
+
+    def sync(self, stories):
+        """Index appended stories; rebuild if the list was rewritten."""
+        n = len(self.ids)
+        if len(stories) < n or (n and stories[n - 1].get('id') != self.ids[-1]):
+            self._reset()
+            n = 0
+        for story in stories[n:]:
+            self.add(story)
+
+    def add(self, story):
+        ordinal = len(self.ids)
+        self.ids.append(story['id'])
+        self.ordinals[story['id']] = ordinal
+        first = {}
+        for i, field in enumerate(SNIPPET_FIELDS):
+            for word, position in first_positions(story.get(field), i).items():
+                first.setdefault(word, position)
+        words = set(first)
+        for field in SEARCH_FIELDS:
+            if field not in SNIPPET_FIELDS:
+                words.update(tokenize(story.get(field)))
+        for tag in story.get('tags', []):
+            words.update(tokenize(tag))
+        for word in words:
+            w = self.vocab.get(word)
+            if w is None:
+                w = self.vocab[word] = len(self.words)
+                self.words.append(word)
+                self.postings.append(array('I'))
+                self.positions.append(array('I'))
+                for g in trigrams(word):
+                    self.grams.setdefault(g, array('I')).append(w)
+            self.postings[w].append(ordinal)
+            self.positions[w].append(first.get(word, NO_POSITION))
+
+    # ─── Term matching ────────────────────────────────────────────────────
+
+    def _containing(self, term):
+        """Vocabulary ids of words containing term as a substring."""
+        if len(term) < 3:
+            # Too short for inner trigrams: match it as a word prefix instead.
+            return {w for w in self.grams.get('$' + term, ()) if self.words[w].startswith(term)}
+        gram_lists = sorted((self.grams.get(g, ()) for g in trigrams(term, padded=False)), key=len)
+        if not gram_lists[0]:
+            return set()
+        candidates = set(gram_lists[0])
+        for lst in gram_lists[1:]:
+            candidates.intersection_update(lst)
+            if not candidates:
+                break
+        return {w for w in candidates if term in self.words[w]}
+
+    def _similar(self, term):
+        """{word id: edit distance} for words within the term's edit budget."""
+        k = max_edits(term)
+        if not k:
+            return {}
+        grams = trigrams(term)
+        need = max(1, len(grams) - 3 * k)
+        shared = Counter()
+        for g in grams:
+            shared.update(self.grams.get(g, ()))
+        result = {}
+        for w, count in shared.items():
+            if count >= need:
+                d = edit_distance(term, self.words[w], k)
+                if d <= k:
+                    result[w] = d
+        return result
+
+    def match_words(self, term):
+        """{word id: (tier, edits)} for vocabulary words matching a query term."""
+        words = {w: (EXACT, 0) for w in self._containing(term)}
+        for w, d in self._similar(term).items():
+            words.setdefault(w, (FUZZY, d))
+        return words
+
+    def _expand(self, words):
+        """{ordinal: (tier, edits)} from the posting lists of matched words."""
+        hits = {}
+        for w, rank in words.items():
+            for o in self.postings[w]:
+                if hits.get(o, (FUZZY, rank[1] + 1)) > rank:
+                    hits[o] = rank
+        return hits
+
+    def _probe(self, words, ordinals):
+        """Like _expand, but only for the given ordinals, by bisecting postings."""
+        hits = {}
+        for o in ordinals:
+            for w, rank in words.items():
+                postings = self.postings[w]
+                i = bisect_left(postings, o)
+                if i < len(postings) and postings[i] == o and hits.get(o, (FUZZY, rank[1] + 1)) > rank:
+                    hits[o] = rank
+        return hits
+
+    def match_query(self, query):
+        """One match_words() result per query term, or None without indexable terms."""
+        terms = [t for t in dict.fromkeys(tokenize(query)) if len(t) > 1]
+        if not terms:
+            return None
+        return [self.match_words(t) for t in terms]
+
+    def estimate(self, matched):
+        """An upper bound on the hits for a match_query() result: its rarest term's postings."""
+        return min(sum(len(self.postings[w]) for w in words) for words in matched)
+
+    def search(self, query, matched=None, within=None):
+        """Rank stories matching every query term: {story_id: (tier, edits)}.
+
+        Tier 0 means every term was found as written; tier 1 means at least
+        one term only matched within its typo budget. Edits are summed.
+        Returns None when the query has no indexable terms. Pass the query's
+        match_query() result as `matched` to reuse it for snippets, and a
+        list of story ids as `within` to only consider those stories.
+        """
+        if matched is None:
+            matched = self.match_query(query)
+        if not matched:
+            return None
+        # Most selective term first; later terms only probe its survivors.
+        sizes = [sum(len(self.postings[w]) for w in words) for words in matched]
+        order = sorted(range(len(matched)), key=sizes.__getitem__)
+        if within is None:
+            result = self._expand(matched[order[0]])
+        else:
+            ordinals = sorted(self.ordinals[i] for i in within if i in self.ordinals)
+            result = self._probe(matched[order[0]], ordinals)
+        for i in order[1:]:
+            if not result:
+                break
+            words = matched[i]
+            if len(result) * len(words) * 16 < sizes[i]:
+                hits = self._probe(words, result)
+            else:
+                hits = self._expand(words)
+            result = {o: (max(tier, hits[o][0]), edits + hits[o][1])
+                      for o, (tier, edits) in result.items() if o in hits}
+        return {self.ids[o]: rank for o, rank in result.items()}
+
+    # ─── Snippets ─────────────────────────────────────────────────────────
+
+    def highlighter(self, matched):
+        """The highlighter for every word a match_query() result matched."""
+        return highlighter({self.words[w] for words in matched for w in words})
+
+    def snippet(self, story_id, matched, read, pattern=None):
+        """Highlighted segments of the body window with the most query terms.
+
+        `matched` is the query's match_query() result, and read(field,
+        start, stop) returns those bytes of one of the story's text fields.
+        Pass self.highlighter(matched) as `pattern` when making several
+        snippets for one query. Returns None if no term occurs in the body
+        or key learning.
+        """
+        o = self.ordinals.get(story_id)
+        if o is None:
+            return None
+        found = []
+        for term, term_words in enumerate(matched):
+            for w in term_words:
+                postings = self.postings[w]
+                i = bisect_left(postings, o)
+                if i < len(postings) and postings[i] == o and self.positions[w][i] != NO_POSITION:
+                    found.append((self.positions[w][i], term))
+        if not found:
+            return None
+        # The window starting at a match that covers the most distinct terms.
+        found.sort()
+        best, anchor = 0, found[0][0]
+        for i, (start, _) in enumerate(found):
+            terms = {t for p, t in found[i:] if p >> _FIELD_SHIFT == start >> _FIELD_SHIFT
+                     and p - start < SNIPPET_BYTES - SNIPPET_LEAD}
+            if len(terms) > best:
+                best, anchor = len(terms), start
+        field, offset = SNIPPET_FIELDS[anchor >> _FIELD_SHIFT], anchor & _OFFSET_MASK
+        begin = max(0, offset - SNIPPET_LEAD)
+        raw = read(field, begin, begin + SNIPPET_BYTES)
+        text = raw.decode('utf-8', 'ignore')
+        if begin:
+            text = '…' + text.split(' ', 1)[-1]  # drop the word cut in half
+        if len(raw) == SNIPPET_BYTES and ' ' in text:
+            text = text[:text.rfind(' ')] + '…'
+        return highlight(text, pattern or self.highlighter(matched))
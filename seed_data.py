@@ -1,5 +1,19 @@
-"""50 detailed rejection stories for the YC Rejections Platform."""
+"""Seed data for the YC Rejections Platform.
+
+get_seed_stories() and get_seed_comments() return the 50 hand-written stories
+the app starts with. generate_corpus() and write_corpus() build a synthetic
+corpus of any size from the same material, for load testing; run this module
+to write one into DATA_DIR.
+"""
+import os
+import re
+import json
+import math
 import uuid
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
 
 
 def get_seed_stories():
@@ -997,3 +1011,218 @@ def get_seed_comments(stories):
         comments.extend(story_comments_list)
 
     return comments
+
+
+# ─── Synthetic corpora ────────────────────────────────────────────────────────
+#
+# Deterministic, seedable corpora of any size built from the hand-written
+# seed stories above, for load testing. Field values are drawn from the seed
+# data's own distributions; votes are heavy-tailed, tags follow a Zipf-like
+# popularity curve, and comment threads nest to realistic depths.
+
+YEARS = list(range(2015, 2026))
+MAX_THREAD_DEPTH = 6
+REPLY_PROBABILITY = 0.45
+EPOCH_START = 1420070400  # 2015-01-01
+EPOCH_END = 1767225599    # 2025-12-31
+
+
+class CorpusTemplates:
+    """Pools and weights derived once from the seed stories and comments."""
+
+    def __init__(self):
+        self.stories = get_seed_stories()
+        self.comments = get_seed_comments(self.stories)
+
+        platforms = Counter(s['platform'] for s in self.stories)
+        self.platforms = list(platforms)
+        self.platform_weights = [platforms[p] for p in self.platforms]
+        self.by_platform = {p: [s for s in self.stories if s['platform'] == p] for p in self.platforms}
+
+        tags = Counter(t for s in self.stories for t in s['tags'])
+        self.tags = [t for t, _ in tags.most_common()]
+        self.tag_weights = [1.0 / (rank + 1) ** 1.1 for rank in range(len(self.tags))]
+
+        self.paragraphs = [p for s in self.stories for p in s['story'].split('\n\n') if p.strip()]
+        named = [s for s in self.stories if not s['is_anonymous']]
+        self.first_names = sorted({s['founder_name'].split()[0] for s in named})
+        self.last_names = sorted({s['founder_name'].split()[-1] for s in named})
+        words = [w for s in named for w in re.findall(r'[A-Z][a-z]+', s['company_name'])]
+        self.company_words = sorted(set(words))
+        self.anonymous_rate = sum(s['is_anonymous'] for s in self.stories) / len(self.stories)
+        self.comment_authors = sorted({c['author'] for c in self.comments})
+        self.year_re = re.compile(r'20\d\d')
+        self.number_re = re.compile(r'\b\d{2}\b')
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _heavy_tail(rng, alpha, cap):
+    return min(cap, int(rng.paretovariate(alpha)) - 1)
+
+
+def generate_story(rng, index, t):
+    """One synthetic story modelled on a random seed story."""
+    platform = rng.choices(t.platforms, t.platform_weights)[0]
+    base = rng.choice(t.by_platform[platform])
+
+    # Later years are more common, as the community grows.
+    created = int(EPOCH_START + (EPOCH_END - EPOCH_START) * rng.random() ** 0.6)
+    rejected = created - rng.randint(1, 400) * 86400
+    year = _iso(rejected)[:4]
+    if platform == 'Y Combinator':
+        batch = rng.choice('WS') + year
+    else:
+        batch = t.year_re.sub(year, base['batch'])
+        batch = t.number_re.sub(lambda m: str(rng.randint(20, 45)), batch)
+
+    anonymous = rng.random() < t.anonymous_rate
+    if anonymous:
+        founder = 'Anonymous'
+        company = 'Stealth ' + base['category'].split()[0].split('/')[0]
+    else:
+        founder = '%s %s' % (rng.choice(t.first_names), rng.choice(t.last_names))
+        company = ''.join(rng.sample(t.company_words, 2))
+
+    tags = rng.sample(base['tags'], rng.randint(1, len(base['tags'])))
+    for tag in rng.choices(t.tags, t.tag_weights, k=rng.choice((0, 0, 1, 1, 2))):
+        if tag not in tags:
+            tags.append(tag)
+
+    # Body length is log-normal in paragraphs, drawn from the whole seed pool.
+    paragraphs = max(1, min(20, int(rng.lognormvariate(1.2, 0.6))))
+    body = base['story'].split('\n\n')[:1] + rng.sample(t.paragraphs, min(paragraphs, len(t.paragraphs)))
+    learning = rng.choice(t.stories)
+
+    def personalise(text):
+        return text.replace(base['company_name'], company)
+
+    return {
+        'id': 'g%07d' % index,
+        'founder_name': founder,
+        'company_name': company,
+        'is_anonymous': anonymous,
+        'platform': platform,
+        'batch': batch,
+        'reviewer': base['reviewer'],
+        'rejection_date': _iso(rejected)[:10],
+        'category': base['category'],
+        'tags': tags,
+        'title': personalise(base['title']),
+        'rejection_reason': base['rejection_reason'],
+        'story': personalise('\n\n'.join(body)),
+        'key_learning': learning['key_learning'],
+        'advice_for_applicants': learning['advice_for_applicants'],
+        'votes': _heavy_tail(rng, 1.16, 100000),
+        'created_at': _iso(created),
+    }
+
+
+def generate_comments(rng, story, t, now):
+    """Threaded comments for one story; busier stories get more of them.
+
+    Comment times never run past `now`, however late the story was posted.
+    """
+    mean = 0.3 + math.log1p(story['votes'])
+    count = int(rng.expovariate(1.0 / mean))
+    created = int(time_from_iso(story['created_at']))
+    thread = []  # (comment id, depth)
+    comments = []
+    for n in range(count):
+        parent_id, depth = None, 0
+        if thread and rng.random() < REPLY_PROBABILITY:
+            parent_id, parent_depth = rng.choice(thread)
+            if parent_depth + 1 < MAX_THREAD_DEPTH:
+                depth = parent_depth + 1
+            else:
+                parent_id = None
+        created = min(created + rng.randint(60, 3 * 86400), now)
+        comment_id = 'c%s%03d' % (story['id'], n)
+        thread.append((comment_id, depth))
+        comments.append({
+            'id': comment_id,
+            'story_id': story['id'],
+            'author': '%s%d' % (rng.choice(t.comment_authors), rng.randint(1, 999)),
+            'text': rng.choice(t.comments)['text'],
+            'parent_id': parent_id,
+            'votes': _heavy_tail(rng, 1.5, 5000),
+            'created_at': _iso(created),
+        })
+    return comments
+
+
+def time_from_iso(value):
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+def generate_corpus(count, seed=0, now=None):
+    """Yield (story, comments) pairs for a deterministic corpus of `count` stories."""
+    now = int(time.time() if now is None else now)
+    rng = random.Random(seed)
+    t = CorpusTemplates()
+    for i in range(count):
+        story = generate_story(rng, i, t)
+        comments = generate_comments(rng, story, t, now)
+        story['comment_count'] = len(comments)
+        story['last_activity_at'] = comments[-1]['created_at'] if comments else story['created_at']
+        yield story, comments
+
+
+class JsonCorpusWriter:
+    """Streams stories and comments into the JSON files the app reads."""
+
+    def __init__(self, data_dir):
+        os.makedirs(data_dir, exist_ok=True)
+        self.paths = [os.path.join(data_dir, 'stories.json'), os.path.join(data_dir, 'comments.json')]
+        self.files = [open(p + '.tmp', 'w', encoding='utf-8') for p in self.paths]
+        self.counts = [0, 0]
+
+    def _write(self, which, item):
+        f = self.files[which]
+        f.write(',\n' if self.counts[which] else '[\n')
+        f.write(json.dumps(item, ensure_ascii=False))
+        self.counts[which] += 1
+
+    def add_story(self, story):
+        self._write(0, story)
+
+    def add_comment(self, comment):
+        self._write(1, comment)
+
+    def close(self, commit=True):
+        for f, path, n in zip(self.files, self.paths, self.counts):
+            f.write('\n]\n' if n else '[]\n')
+            f.close()
+            if commit:
+                os.replace(path + '.tmp', path)
+            else:
+                os.remove(path + '.tmp')
+
+
+def write_corpus(count, data_dir, seed=0):
+    """Generate a corpus and stream it into the configured data directory."""
+    writer = JsonCorpusWriter(data_dir)
+    try:
+        for story, comments in generate_corpus(count, seed):
+            writer.add_story(story)
+            for comment in comments:
+                writer.add_comment(comment)
+    except BaseException:
+        writer.close(commit=False)
+        raise
+    writer.close()
+    return writer.counts
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate a synthetic corpus for load testing.')
+    parser.add_argument('count', type=int, help='number of stories')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.environ.get('DATA_DIR') or
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+    args = parser.parse_args()
+    stories, comments = write_corpus(args.count, args.data_dir, args.seed)
+    print('Wrote %d stories and %d comments to %s' % (stories, comments, args.data_dir))
@@ -0,0 +1,98 @@
+"""Sitemap index and 50k-URL sitemap shards for the story pages.
+
+Stories are append-only, so shard n always holds stories n*SHARD_SIZE up
+to (n+1)*SHARD_SIZE, and only the last shard changes when stories are
+added. Each shard keeps a running BLAKE2 digest of its ids and its newest
+created_at. Adding a story updates one digest, and the full shards keep
+their ETag and Last-Modified for good. A rewritten story list (a dedupe
+merge, say) resets everything. Shards are written out by a generator,
+URL_BATCH URLs per chunk.
+"""
+import hashlib
+from xml.sax.saxutils import escape
+
+SHARD_SIZE = 50000
+URL_BATCH = 1000
+
+
+class Shard:
+    __slots__ = ('start', 'end', 'digest', 'lastmod')
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.digest = hashlib.blake2b(digest_size=12)
+        self.lastmod = ''
+
+    @property
+    def etag(self):
+        return self.digest.copy().hexdigest()
+
+
+class Sitemaps:
+    """Story ids and dates, split into shards, synced from the story list."""
+
+    def __init__(self, shard_size=SHARD_SIZE):
+        self.shard_size = shard_size
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.dates = []
+        self.shards = []
+
+    def sync(self, stories):
+        """Add appended stories; rebuild if the list was rewritten."""
+        n = len(self.ids)
+        if len(stories) < n or (n and stories[n - 1].get('id') != self.ids[-1]):
+            self._reset()
+            n = 0
+        for story in stories[n:]:
+            self.add(story)
+        return self
+
+    @property
+    def etag(self):
+        digest = hashlib.blake2b(digest_size=12)
+        for shard in self.shards:
+            digest.update(shard.etag.encode('ascii'))
+        return digest.hexdigest()
+
+    @property
+    def lastmod(self):
+        return max((shard.lastmod for shard in self.shards), default='')
+
+    def add(self, story):
+        if not self.shards or self.shards[-1].end - self.shards[-1].start == self.shard_size:
+            self.shards.append(Shard(len(self.ids)))
+        shard = self.shards[-1]
+        created = story.get('created_at') or ''
+        self.ids.append(story['id'])
+        self.dates.append(created[:10])
+        shard.end += 1
+        shard.digest.update(('%s\0%s\n' % (story['id'], created)).encode('utf-8'))
+        if created > shard.lastmod:
+            shard.lastmod = created
+
+    def index_xml(self, shard_url):
+        """Yield the sitemap index; shard_url(n) is the absolute URL of shard n."""
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for n, shard in enumerate(self.shards):
+            lastmod = '<lastmod>%s</lastmod>' % shard.lastmod[:10] if shard.lastmod else ''
+            yield '<sitemap><loc>%s</loc>%s</sitemap>\n' % (escape(shard_url(n)), lastmod)
+        yield '</sitemapindex>\n'
+
+    def shard_xml(self, n, story_url_prefix):
+        """Yield shard n's urlset, URL_BATCH URLs at a time."""
+        shard = self.shards[n]
+        ids, dates = self.ids, self.dates  # a concurrent rewrite swaps in new lists
+        prefix = escape(story_url_prefix)
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for start in range(shard.start, shard.end, URL_BATCH):
+            stop = min(start + URL_BATCH, shard.end)
+            yield ''.join('<url><loc>%s%s</loc>%s</url>\n'
+                          % (prefix, escape(story_id), '<lastmod>%s</lastmod>' % date if date else '')
+                          for story_id, date in zip(ids[start:stop], dates[start:stop]))
+        yield '</urlset>\n'
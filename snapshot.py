@@ -0,0 +1,73 @@
+"""Binary snapshots of the JSON data files, for fast loads.
+
+A snapshot holds one data file's contents, serialised with ``marshal``.
+Marshal parses many times faster than ``json.load``, and it writes repeated
+strings (every story's keys, platforms, batches) once and shares them on
+load. The file is a fixed header followed by the payload:
+
+    magic, format version, marshal version, source stamp, CRC-32, length
+
+The source stamp is the (mtime_ns, size, inode) of the JSON file the
+snapshot was taken from. Every save replaces the file, so it gets a new
+inode, even when a same-size rewrite lands within the mtime granularity. A snapshot is only used while that JSON file is unchanged, so
+the JSON stays authoritative and exportable, and anything that rewrites it
+directly (seeding, a hand edit, the benchmark corpus writer) simply makes
+the snapshot stale. A wrong magic, version, length or checksum makes
+``read`` return None, and the caller falls back to the JSON.
+"""
+import os
+import zlib
+import struct
+import marshal
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'YCSNAP'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<6sHHqQQIQ')  # magic, version, marshal version, mtime_ns, size, inode, crc, length
+SUFFIX = '.snap'
+
+
+def path_for(json_path):
+    return json_path + SUFFIX
+
+
+def stamp(st):
+    """The source stamp of an os.stat() result."""
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def write(path, data, source):
+    """Atomically write data as a snapshot of the file stamped `source`."""
+    payload = marshal.dumps(data)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version, *source,
+                         zlib.crc32(payload), len(payload))
+    tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp, path)
+    return len(header) + len(payload)
+
+
+def read(path, source):
+    """The snapshot's data if it is intact and was taken from `source`, else None."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return None
+            magic, version, marshal_version, mtime_ns, size, inode, crc, length = HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION or marshal_version != marshal.version:
+                return None
+            if (mtime_ns, size, inode) != tuple(source):
+                return None  # stale: the JSON has been written since
+            payload = f.read(length)
+    except FileNotFoundError:
+        return None
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        log.warning('Ignoring corrupt snapshot %s', path)
+        return None
+    return marshal.loads(payload)
@@ -1,37 +1,72 @@
 /* ═══════════════════════════════════════════════════════════════════════════
    YC Postmortem — JavaScript
-   Voting, Comments, Reply Forms, Anonymity Toggle
+   Voting, Comments, Reply Forms, Anonymity Toggle, Search Suggestions, Live Counts
    ═══════════════════════════════════════════════════════════════════════════ */
 
 // ─── Voting ───────────────────────────────────────────────────────────────
+// Clicks are queued and sent together to /api/vote/batch, shortly after the
+// first one or as soon as the page is hidden.
+const VOTE_FLUSH_MS = 400;
+let voteQueue = [];
+let voteTimer = null;
+
 function vote(itemId, itemType, direction, btn) {
-    fetch('/api/vote', {
+    if (voteQueue.some(v => v.id === itemId && v.type === itemType)) return;
+    voteQueue.push({ id: itemId, type: itemType, direction: direction, btn: btn });
+    if (!voteTimer) voteTimer = setTimeout(flushVotes, VOTE_FLUSH_MS);
+}
+
+function takeVotes() {
+    clearTimeout(voteTimer);
+    voteTimer = null;
+    const queued = voteQueue;
+    voteQueue = [];
+    const body = JSON.stringify({
+        votes: queued.map(v => ({ id: v.id, type: v.type, direction: v.direction }))
+    });
+    return { queued: queued, body: body };
+}
+
+function flushVotes() {
+    if (!voteQueue.length) return;
+    const { queued, body } = takeVotes();
+    fetch('/api/vote/batch', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-            id: itemId,
-            type: itemType,
-            direction: direction
-        })
+        body: body
     })
     .then(res => res.json())
     .then(data => {
-        if (data.success) {
-            // Update the vote count display
-            const voteCountEl = btn.parentElement.querySelector('.vote-count');
-            if (voteCountEl) {
-                voteCountEl.textContent = data.votes;
-            }
-            // Add voted class for visual feedback
-            btn.classList.add('voted');
-            // Brief animation
-            btn.style.transform = 'scale(1.3)';
-            setTimeout(() => { btn.style.transform = 'scale(1)'; }, 150);
-        }
+        (data.results || []).forEach((result, i) => showVote(queued[i].btn, result));
     })
     .catch(err => console.error('Vote error:', err));
 }
 
+function showVote(btn, result) {
+    if (result.status === 'ok') {
+        // Update the vote count display
+        const voteCountEl = btn.parentElement.querySelector('.vote-count');
+        if (voteCountEl) {
+            voteCountEl.textContent = result.votes;
+        }
+        // Add voted class for visual feedback
+        btn.classList.add('voted');
+        // Brief animation
+        btn.style.transform = 'scale(1.3)';
+        setTimeout(() => { btn.style.transform = 'scale(1)'; }, 150);
+    } else if (result.status === 'duplicate') {
+        btn.classList.add('voted');
+    }
+}
+
+// A page being closed or backgrounded can't wait for the timer.
+document.addEventListener('visibilitychange', function() {
+    if (document.visibilityState === 'hidden' && voteQueue.length) {
+        const { body } = takeVotes();
+        navigator.sendBeacon('/api/vote/batch', new Blob([body], { type: 'application/json' }));
+    }
+});
+
 // ─── Comments ─────────────────────────────────────────────────────────────
 function submitComment(storyId, parentId) {
     let authorInput, textInput;
@@ -112,6 +147,115 @@ function showReplyForm(commentId, storyId) {
     container.querySelector('.reply-text').focus();
 }
 
+// ─── Search Suggestions ───────────────────────────────────────────────────
+function attachSuggest(input) {
+    const list = document.createElement('ul');
+    list.className = 'suggest-list';
+    list.hidden = true;
+    input.parentElement.appendChild(list);
+
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    function render(items) {
+        active = -1;
+        list.innerHTML = '';
+        items.forEach(item => {
+            const li = document.createElement('li');
+            const a = document.createElement('a');
+            a.href = item.url;
+            a.textContent = item.text;
+            const kind = document.createElement('span');
+            kind.className = 'suggest-kind';
+            kind.textContent = item.kind;
+            a.appendChild(kind);
+            li.appendChild(a);
+            list.appendChild(li);
+        });
+        list.hidden = items.length === 0;
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (!q) { render([]); return; }
+        timer = setTimeout(() => {
+            if (controller) controller.abort();
+            controller = new AbortController();
+            fetch('/api/suggest?q=' + encodeURIComponent(q), { signal: controller.signal })
+                .then(res => res.json())
+                .then(data => render(data.suggestions || []))
+                .catch(() => {});
+        }, 150);
+    });
+
+    input.addEventListener('keydown', function(e) {
+        const items = list.querySelectorAll('li');
+        if (list.hidden || !items.length) return;
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            if (active >= 0) items[active].classList.remove('active');
+            active = (active + (e.key === 'ArrowDown' ? 1 : items.length - 1)) % items.length;
+            items[active].classList.add('active');
+        } else if (e.key === 'Enter' && active >= 0) {
+            e.preventDefault();
+            window.location = items[active].querySelector('a').href;
+        } else if (e.key === 'Escape') {
+            render([]);
+        }
+    });
+
+    input.addEventListener('blur', () => setTimeout(() => { list.hidden = true; }, 150));
+}
+
+// ─── Live Counts ──────────────────────────────────────────────────────────
+// Streamed over Server-Sent Events when the server can hold streams open
+// (body data-live="stream"); otherwise polled while the tab is visible.
+const LIVE_POLL_MS = 30000;
+
+function connectLiveCounts() {
+    const blocks = document.querySelectorAll('[data-live-story]');
+    if (!blocks.length) return;
+    const ids = [...new Set([...blocks].map(el => el.dataset.liveStory))];
+    const query = '?stories=' + encodeURIComponent(ids.join(','));
+    const applyAll = stories => Object.keys(stories).forEach(id => applyLiveCounts(id, stories[id]));
+    if (document.body.dataset.live === 'stream' && window.EventSource) {
+        const source = new EventSource('/api/live' + query);
+        source.addEventListener('counts', event => applyAll(JSON.parse(event.data)));
+        return;
+    }
+    setInterval(() => {
+        if (document.hidden) return;
+        fetch('/api/counts' + query)
+            .then(res => res.ok ? res.json() : {})
+            .then(applyAll)
+            .catch(() => {});
+    }, LIVE_POLL_MS);
+}
+
+function applyLiveCounts(storyId, counts) {
+    const sel = CSS.escape(storyId);
+    if (counts.votes !== undefined) {
+        document.querySelectorAll('[data-live-story="' + sel + '"] .vote-count').forEach(el => {
+            el.textContent = counts.votes;
+        });
+    }
+    if (counts.comments || counts.comment_count !== undefined) {
+        document.querySelectorAll('[data-live-comments="' + sel + '"]').forEach(el => {
+            const total = counts.comment_count !== undefined
+                ? counts.comment_count : parseInt(el.dataset.count, 10) + counts.comments;
+            el.dataset.count = total;
+            el.textContent = (el.dataset.format || '({n} comments)').replace('{n}', total);
+        });
+    }
+    Object.entries(counts.comment_votes || {}).forEach(([commentId, votes]) => {
+        const comment = document.getElementById('comment-' + commentId);
+        const el = comment && comment.querySelector(':scope > .comment-vote .vote-count');
+        if (el) el.textContent = votes;
+    });
+}
+
 // ─── Anonymity Toggle ─────────────────────────────────────────────────────
 document.addEventListener('DOMContentLoaded', function() {
     const anonToggle = document.getElementById('is_anonymous');
@@ -136,6 +280,9 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    document.querySelectorAll('.nav-search .search-input').forEach(attachSuggest);
+    connectLiveCounts();
+
     // Smooth scroll for hero CTA
     const heroBtn = document.querySelector('.btn-hero');
     if (heroBtn) {
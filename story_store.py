@@ -0,0 +1,276 @@
+"""Compact in-memory story records for the read paths.
+
+Parsed story dicts repeat the same platform, batch, category, reason and tag
+strings in every record, and carry the full story body, key learning and
+advice even though the feed only shows a short excerpt. ``StoryStore`` keeps
+one ``__slots__`` record per story instead, with categorical values interned
+so each distinct string exists once, and moves the long text fields into a
+separate ``BodyStore`` that is only read by the detail page and the indexers.
+
+Records answer ``record['field']`` and ``record.get('field')`` for both
+metadata and text fields, so code written against story dicts keeps working.
+"""
+import os
+import sys
+import mmap
+import fcntl
+import struct
+import hashlib
+import threading
+
+# Story key, content digest, data offset, one length per text field. Ids
+# longer than the key are stored as a hash of the id.
+ENTRY = struct.Struct('<16s8sQIII')
+
+TEXT_FIELDS = ('story', 'key_learning', 'advice_for_applicants')
+CATEGORICAL = ('platform', 'batch', 'reviewer', 'category', 'rejection_reason')
+EXCERPT_CHARS = 200
+
+
+class StoryRecord:
+    """Feed metadata for one story; long text is fetched from its BodyStore."""
+
+    __slots__ = ('id', 'founder_name', 'company_name', 'is_anonymous', 'platform', 'batch',
+                 'reviewer', 'rejection_date', 'category', 'tags', 'title', 'rejection_reason',
+                 'votes', 'created_at', 'comment_count', 'last_activity_at',
+                 'key_learning_excerpt', 'key_learning_truncated', 'extra', 'texts')
+
+    def __init__(self, story, texts):
+        intern = sys.intern
+        self.id = story['id']
+        self.founder_name = story.get('founder_name', '')
+        self.company_name = story.get('company_name', '')
+        self.is_anonymous = bool(story.get('is_anonymous'))
+        for field in CATEGORICAL:
+            setattr(self, field, intern(story.get(field) or ''))
+        self.rejection_date = story.get('rejection_date', '')
+        self.tags = tuple(intern(t) for t in story.get('tags', []))
+        self.title = story.get('title', '')
+        self.votes = story.get('votes', 0)
+        self.created_at = story.get('created_at', '')
+        self.comment_count = story.get('comment_count', 0)
+        self.last_activity_at = story.get('last_activity_at') or self.created_at
+        key_learning = story.get('key_learning') or ''
+        self.key_learning_excerpt = key_learning[:EXCERPT_CHARS]
+        self.key_learning_truncated = len(key_learning) > EXCERPT_CHARS
+        extra = {k: v for k, v in story.items() if k not in _KNOWN}
+        self.extra = extra or None
+        self.texts = texts
+
+    def get(self, field, default=None):
+        if field in _SLOTS:
+            return getattr(self, field)
+        if field in TEXT_FIELDS:
+            return self.texts.get(self.id, field)
+        return (self.extra or {}).get(field, default)
+
+    def __getitem__(self, field):
+        value = self.get(field, _MISSING)
+        if value is _MISSING:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field, _MISSING) is not _MISSING
+
+    def as_dict(self):
+        """The full story, text included, as the dict stored on disk."""
+        story = {field: getattr(self, field) for field in _STORY_SLOTS}
+        story['tags'] = list(self.tags)
+        story.update(self.texts.fields(self.id))
+        if self.extra:
+            story.update(self.extra)
+        return story
+
+
+_SLOTS = frozenset(StoryRecord.__slots__) - {'extra', 'texts'}
+_STORY_SLOTS = [f for f in StoryRecord.__slots__ if f in _SLOTS
+                and not f.startswith('key_learning_')]
+_KNOWN = frozenset(_STORY_SLOTS) | frozenset(TEXT_FIELDS)
+_MISSING = object()
+
+
+class BodyStore:
+    """Long text fields in an append-only file, read back through mmap.
+
+    Each story's fields are appended to the data file as UTF-8, and an entry
+    (key, content digest, offset, field lengths) is appended to the index
+    file after the data is written. Every worker tails the index and maps the
+    shared data file, so the bodies are held once in the page cache instead
+    of once per worker. If the files can't be written (a read-only data
+    directory), the text is held in this worker's memory instead.
+    """
+
+    def __init__(self, path, index_path):
+        self.path = path
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (digest, offset, *lengths)
+        self._held = {}     # key -> (digest, encoded fields), for unwritable stores
+        self._index_offset = 0
+        self._map = None
+
+    def put(self, story_id, story):
+        encoded = [(story.get(field) or '').encode('utf-8') for field in TEXT_FIELDS]
+        key, digest = _key(story_id), _digest(encoded)
+        if self._current(key, digest):
+            return
+        try:
+            with open(self.index_path, 'ab') as index:
+                fcntl.flock(index, fcntl.LOCK_EX)
+                try:
+                    # Another worker may have appended the same text while we waited.
+                    if self._current(key, digest):
+                        return
+                    with open(self.path, 'ab') as data:
+                        offset = data.tell()
+                        data.write(b''.join(encoded))
+                    lengths = [len(e) for e in encoded]
+                    index.write(ENTRY.pack(key, digest, offset, *lengths))
+                finally:
+                    fcntl.flock(index, fcntl.LOCK_UN)
+        except OSError:
+            self._held[key] = (digest, encoded)
+            return
+        self._entries[key] = (digest, offset, *lengths)
+        self._held.pop(key, None)
+
+    def _current(self, key, digest):
+        """True if the stored text for the key has this digest."""
+        held = self._held.get(key)
+        if held is not None:
+            return held[0] == digest
+        self.refresh()
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] == digest
+
+    def refresh(self):
+        """Pick up index entries appended since the last call (by any worker)."""
+        try:
+            size = os.path.getsize(self.index_path)
+        except OSError:
+            return
+        if size == self._index_offset:
+            return
+        with self._lock:
+            if size < self._index_offset:
+                self._entries = {}
+                self._index_offset = 0
+                self._map = None
+            with open(self.index_path, 'rb') as f:
+                f.seek(self._index_offset)
+                chunk = f.read(size - self._index_offset)
+            usable = len(chunk) - len(chunk) % ENTRY.size
+            for key, digest, offset, *lengths in ENTRY.iter_unpack(chunk[:usable]):
+                self._entries[key.rstrip(b'\0')] = (digest, offset, *lengths)
+            self._index_offset += usable
+
+    def _view(self, end):
+        """The data file mapping, remapped when it does not reach `end` yet."""
+        view = self._map
+        if view is None or len(view) < end:
+            with self._lock:
+                with open(self.path, 'rb') as f:
+                    view = self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return view
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.refresh()
+            entry = self._entries[key]
+        return entry
+
+    def _read(self, offset, length):
+        if not length:
+            return ''
+        return self._view(offset + length)[offset:offset + length].decode('utf-8')
+
+    def fields(self, story_id):
+        key = _key(story_id)
+        held = self._held.get(key)
+        if held is not None:
+            return {field: e.decode('utf-8') for field, e in zip(TEXT_FIELDS, held[1])}
+        _, offset, *lengths = self._entry(key)
+        result = {}
+        for field, length in zip(TEXT_FIELDS, lengths):
+            result[field] = self._read(offset, length)
+            offset += length
+        return result
+
+    def get(self, story_id, field):
+        key = _key(story_id)
+        i = TEXT_FIELDS.index(field)
+        held = self._held.get(key)
+        if held is not None:
+            return held[1][i].decode('utf-8')
+        _, offset, *lengths = self._entry(key)
+        return self._read(offset + sum(lengths[:i]), lengths[i])
+
+    def read_bytes(self, story_id, field, start, stop):
+        """Bytes start:stop of a field's UTF-8, without decoding the rest of it."""
+        key = _key(story_id)
+        i = TEXT_FIELDS.index(field)
+        held = self._held.get(key)
+        if held is not None:
+            return held[1][i][start:stop]
+        _, offset, *lengths = self._entry(key)
+        base = offset + sum(lengths[:i])
+        stop = min(stop, lengths[i])
+        if start >= stop:
+            return b''
+        return self._view(base + stop)[base + start:base + stop]
+
+
+def _key(story_id):
+    raw = story_id.encode('utf-8')
+    if len(raw) > 16 or raw.endswith(b'\0'):
+        raw = hashlib.blake2b(raw, digest_size=16).digest()
+    return raw.rstrip(b'\0')
+
+
+def _digest(encoded):
+    h = hashlib.blake2b(digest_size=8)
+    for e in encoded:
+        h.update(struct.pack('<I', len(e)))
+        h.update(e)
+    return h.digest()
+
+
+class StoryStore:
+    """Compact records for the story list, synced from parsed stories."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self._reset()
+
+    def _reset(self):
+        self.records = []
+        self.by_id = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def sync(self, stories):
+        """Refresh counters in place and add appended stories; rebuild on rewrites."""
+        n = len(self.records)
+        if len(stories) < n or (n and stories[n - 1].get('id') != self.records[-1].id):
+            self._reset()
+            n = 0
+        for record, story in zip(self.records, stories):
+            record.votes = story.get('votes', 0)
+            record.comment_count = story.get('comment_count', 0)
+            record.last_activity_at = story.get('last_activity_at') or record.created_at
+        for story in stories[n:]:
+            self.add(story)
+        return self.records
+
+    def add(self, story):
+        self.texts.put(story['id'], story)
+        record = StoryRecord(story, self.texts)
+        self.records.append(record)
+        self.by_id[record.id] = record
+        return record
+
+    def get(self, story_id):
+        return self.by_id.get(story_id)
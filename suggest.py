@@ -0,0 +1,182 @@
+"""Search-as-you-type suggestions from a sorted-array prefix index.
+
+Every suggestible string (story titles, company names, non-anonymous founder
+names, tags and batches) is normalised into one or more keys and kept in a
+sorted list alongside a reference to its entry. A prefix query is a pair of
+bisects; the best entries by vote weight are taken from that slice. Prefixes
+whose slices are large (every prefix up to SHORT_PREFIX characters, and
+longer ones matching more than MAX_SCAN keys when the index was built) keep
+a precomputed top list by weight instead.
+
+Stories added between rebuilds go to a small pending list that is searched
+linearly and merged into the sorted arrays in one pass once it fills up.
+"""
+import re
+import time
+import heapq
+import bisect
+from urllib.parse import quote
+from collections import defaultdict
+
+WORD_RE = re.compile(r'[a-z0-9][a-z0-9+#.]*')
+SHORT_PREFIX = 3      # prefixes up to this length are served from top lists
+MAX_KEY = 32          # longer queries are verified against the full text
+MAX_SCAN = 4000      # longer prefixes matching more keys than this get top lists
+MERGE_AT = 512       # pending keys merged into the sorted arrays at this size
+TOP_K = 8
+REBUILD_SECONDS = 300  # refresh vote weights at most this often
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+class SuggestIndex:
+    """Sorted keys -> entries, with precomputed tops for short and common prefixes."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.keys = []
+        self.refs = []
+        self.entries = []     # [text, kind, target, weight]
+        self._entry_ids = {}  # (kind, text) -> entry index
+        self._tops = defaultdict(list)  # prefix -> up to 2 * TOP_K entries, best first after a trim
+        self._hot = set()     # prefixes longer than SHORT_PREFIX that have top lists
+        self._pending = []    # (key, entry) added since the last merge, unsorted
+        self._ids = []
+        self._built_at = 0.0
+
+    def sync(self, stories):
+        """Fold in appended stories; rebuild when weights are stale."""
+        n = len(self._ids)
+        appended = len(stories) >= n and (n == 0 or stories[n - 1].get('id') == self._ids[-1])
+        if not appended or time.time() - self._built_at > REBUILD_SECONDS:
+            self._build(stories)
+        elif len(stories) > n:
+            for story in stories[n:]:
+                self._ids.append(story.get('id'))
+                for entry, keys in self._story_entries(story):
+                    for key in keys:
+                        self._pending.append((key, entry))
+                        self._note_top(key, entry)
+            if len(self._pending) >= MERGE_AT:
+                self._merge_pending()
+
+    def _build(self, stories):
+        self._reset()
+        pairs = []
+        for story in stories:
+            self._ids.append(story.get('id'))
+            for entry, keys in self._story_entries(story):
+                pairs.extend((key, entry) for key in keys)
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.refs = [e for _, e in pairs]
+        self._hot = self._hot_prefixes()
+        for key, entry in pairs:
+            self._note_top(key, entry)
+        self._built_at = time.time()
+
+    def _merge_pending(self):
+        pairs = list(heapq.merge(zip(self.keys, self.refs), sorted(self._pending)))
+        self.keys = [k for k, _ in pairs]
+        self.refs = [e for _, e in pairs]
+        self._pending = []
+
+    def _hot_prefixes(self):
+        """Prefixes longer than SHORT_PREFIX that match more than MAX_SCAN keys.
+
+        A prefix can only be hot if the prefix one character shorter is, so
+        each length only looks inside the ranges of the last one.
+        """
+        keys, hot = self.keys, set()
+        ranges = [(0, len(keys))]
+        for length in range(SHORT_PREFIX + 1, MAX_KEY + 1):
+            found = []
+            for lo, hi in ranges:
+                i = lo
+                while i < hi:
+                    if len(keys[i]) < length:
+                        i += 1
+                        continue
+                    prefix = keys[i][:length]
+                    j = bisect.bisect_left(keys, prefix + '\uffff', i, hi)
+                    if j - i > MAX_SCAN:
+                        hot.add(prefix)
+                        found.append((i, j))
+                    i = j
+            if not found:
+                break
+            ranges = found
+        return hot
+
+    def _story_entries(self, story):
+        """Yield (entry index, keys) for each suggestible field of a story."""
+        votes = story.get('votes', 0)
+        title = story.get('title', '')
+        if title:
+            e = self._entry('title', title, '/story/' + story['id'], votes)
+            yield e, self._title_keys(title)
+        if not story.get('is_anonymous'):
+            for kind, field in (('company', 'company_name'), ('founder', 'founder_name')):
+                text = story.get(field, '')
+                if text:
+                    yield self._shared('/?q=', kind, text, votes)
+        for tag in story.get('tags', []):
+            yield self._shared('/?tag=', 'tag', tag, votes)
+        if story.get('batch'):
+            yield self._shared('/?batch=', 'batch', story['batch'], votes)
+
+    def _entry(self, kind, text, target, weight):
+        self.entries.append([text, kind, target, weight])
+        return len(self.entries) - 1
+
+    def _shared(self, prefix, kind, text, weight):
+        """Entries like tags appear in many stories; votes accumulate."""
+        e = self._entry_ids.get((kind, text))
+        if e is not None:
+            self.entries[e][3] += weight
+            return e, ()
+        e = self._entry_ids[(kind, text)] = self._entry(kind, text, prefix + quote(text), weight)
+        return e, (normalize(text)[:MAX_KEY],)
+
+    def _title_keys(self, title):
+        """A title is reachable from each of its longer words, not just the start."""
+        norm = normalize(title)
+        keys = [norm[:MAX_KEY]]
+        for m in re.finditer(r' ([a-z0-9]{4,})', norm):
+            keys.append(norm[m.start(1):m.start(1) + MAX_KEY])
+        return dict.fromkeys(keys)
+
+    def _note_top(self, key, entry):
+        for n in range(1, len(key) + 1):
+            prefix = key[:n]
+            if n > SHORT_PREFIX and prefix not in self._hot:
+                break  # a longer prefix can't be hot if this one isn't
+            top = self._tops[prefix]
+            if entry not in top:
+                top.append(entry)
+                if len(top) > TOP_K * 2:
+                    top.sort(key=lambda e: -self.entries[e][3])
+                    del top[TOP_K:]
+
+    def suggest(self, query, k=TOP_K):
+        """Return up to k suggestion dicts for a prefix, best first."""
+        q = normalize(query)
+        if not q:
+            return []
+        if len(q) <= SHORT_PREFIX or (len(q) <= MAX_KEY and q in self._hot):
+            candidates = self._tops.get(q, ())
+        else:
+            key = q[:MAX_KEY]
+            lo = bisect.bisect_left(self.keys, key)
+            hi = bisect.bisect_left(self.keys, key + '\uffff', lo)
+            candidates = set(self.refs[lo:hi])
+            candidates.update(e for k, e in self._pending if k.startswith(key))
+            if len(q) > MAX_KEY:
+                candidates = [e for e in candidates if q in normalize(self.entries[e][0])]
+        best = heapq.nlargest(k, candidates, key=lambda e: self.entries[e][3])
+        return [{'text': self.entries[e][0], 'kind': self.entries[e][1], 'url': self.entries[e][2]}
+                for e in best]
@@ -0,0 +1,351 @@
+"""Background task queue for follow-up work after a write.
+
+Handlers are registered by name, and ``enqueue(name, *args)`` returns as
+soon as the task is queued. Worker threads run the tasks and retry failures
+with exponential backoff. Tasks are kept in memory by default. Point the
+queue at a SQLite file to make it durable: tasks then survive restarts, and
+all workers sharing the file take from the same queue.
+
+* back-pressure: when ``max_pending`` tasks are waiting, ``enqueue`` blocks
+  for up to ``put_timeout`` seconds, then runs the task in the caller;
+* de-duplication: a task enqueued with a ``key`` that is already waiting is
+  dropped, which coalesces bursts of idempotent refreshes;
+* shutdown: ``shutdown()`` (also registered with atexit) stops intake and
+  waits for queued and running tasks to finish, up to ``drain_timeout``.
+
+Pass ``context`` (e.g. a Flask app's ``app_context``) to run every handler
+inside the context manager it returns.
+"""
+import json
+import time
+import heapq
+import atexit
+import logging
+import itertools
+import threading
+from contextlib import nullcontext
+
+log = logging.getLogger(__name__)
+
+POLL_SECONDS = 0.5
+STALE_CLAIM_SECONDS = 300.0  # durable tasks claimed this long ago are presumed orphaned
+
+
+class Task:
+    __slots__ = ('id', 'name', 'args', 'key', 'attempts')
+
+    def __init__(self, id, name, args, key=None, attempts=0):
+        self.id = id
+        self.name = name
+        self.args = args
+        self.key = key
+        self.attempts = attempts
+
+
+class MemoryBackend:
+    """Tasks in a heap ordered by run time; lost if the process exits."""
+
+    def __init__(self):
+        self._heap = []
+        self._keys = set()
+        self._running = 0
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def put(self, name, args, key=None, run_at=0.0):
+        with self._cond:
+            if key is not None and key in self._keys:
+                return False
+            task = Task(next(self._ids), name, args, key)
+            heapq.heappush(self._heap, (run_at, task.id, task))
+            if key is not None:
+                self._keys.add(key)
+            self._cond.notify()
+            return True
+
+    def claim(self, timeout):
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= time.time():
+                    task = heapq.heappop(self._heap)[2]
+                    self._keys.discard(task.key)
+                    self._running += 1
+                    return task
+                if now >= deadline:
+                    return None
+                wait = deadline - now
+                if self._heap:
+                    wait = min(wait, max(0.0, self._heap[0][0] - time.time()))
+                self._cond.wait(wait)
+
+    def retry(self, task, run_at):
+        with self._cond:
+            self._running -= 1
+            # Waiting again, so it takes its key back. If the same key was
+            # enqueued while this one ran, that task covers the retry.
+            if task.key is None or task.key not in self._keys:
+                task.attempts += 1
+                heapq.heappush(self._heap, (run_at, task.id, task))
+                if task.key is not None:
+                    self._keys.add(task.key)
+            self._cond.notify_all()
+
+    def done(self, task, failed=False):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def pending(self):
+        return len(self._heap)
+
+    def idle(self):
+        return not self._heap and not self._running
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Tasks in a SQLite table shared by every process that opens the file."""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            args TEXT NOT NULL,
+            key TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_at REAL NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            claimed_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (state, run_at);
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._running = 0
+        self._wake = threading.Condition()
+        self._setup_lock = threading.Lock()
+        self._set_up = False  # the file is only created by the first enqueue or claim
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            import sqlite3  # only durable queues pay for the import
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            if not self._set_up:
+                self._setup(db)
+        return db
+
+    def _setup(self, db):
+        with self._setup_lock:
+            if self._set_up:
+                return
+            db.executescript(self.SCHEMA)
+            with _Transaction(db):
+                # Tasks claimed by a process that died are picked up again.
+                db.execute("UPDATE tasks SET state = 'pending' WHERE state = 'running' AND claimed_at < ?",
+                           (time.time() - STALE_CLAIM_SECONDS,))
+            self._set_up = True
+
+    def _db(self):
+        return _Transaction(self._connect())
+
+    def put(self, name, args, key=None, run_at=0.0):
+        with self._db() as db:
+            if key is not None and db.execute(
+                    "SELECT 1 FROM tasks WHERE key = ? AND state = 'pending'", (key,)).fetchone():
+                return False
+            db.execute('INSERT INTO tasks (name, args, key, run_at) VALUES (?, ?, ?, ?)',
+                       (name, json.dumps(args), key, run_at))
+        with self._wake:
+            self._wake.notify()
+        return True
+
+    def claim(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._db() as db:
+                row = db.execute("SELECT id, name, args, key, attempts FROM tasks "
+                                 "WHERE state = 'pending' AND run_at <= ? ORDER BY run_at, id LIMIT 1",
+                                 (time.time(),)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE tasks SET state = 'running', claimed_at = ? WHERE id = ?",
+                               (time.time(), row[0]))
+            if row is not None:
+                with self._wake:
+                    self._running += 1
+                return Task(row[0], row[1], json.loads(row[2]), row[3], row[4])
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # Other processes may enqueue too, so poll as well as waiting to be woken.
+            with self._wake:
+                self._wake.wait(min(remaining, POLL_SECONDS))
+
+    def retry(self, task, run_at):
+        with self._db() as db:
+            if task.key is not None and db.execute(
+                    "SELECT 1 FROM tasks WHERE key = ? AND state = 'pending'", (task.key,)).fetchone():
+                db.execute('DELETE FROM tasks WHERE id = ?', (task.id,))  # covered by the newer one
+            else:
+                db.execute("UPDATE tasks SET state = 'pending', attempts = attempts + 1, run_at = ? "
+                           "WHERE id = ?", (run_at, task.id))
+        with self._wake:
+            self._running -= 1
+            self._wake.notify_all()
+
+    def done(self, task, failed=False):
+        with self._db() as db:
+            if failed:
+                # Kept for inspection rather than retried forever.
+                db.execute("UPDATE tasks SET state = 'failed' WHERE id = ?", (task.id,))
+            else:
+                db.execute('DELETE FROM tasks WHERE id = ?', (task.id,))
+        with self._wake:
+            self._running -= 1
+            self._wake.notify_all()
+
+    def pending(self):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM tasks WHERE state = 'pending'").fetchone()[0]
+
+    def idle(self):
+        waiting = self._connect().execute(
+            "SELECT 1 FROM tasks WHERE state = 'pending' LIMIT 1").fetchone()
+        return waiting is None and not self._running
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so claims never race across processes."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class TaskQueue:
+    """Named handlers run by worker threads, with retry and back-pressure."""
+
+    def __init__(self, path=None, workers=1, max_pending=1000, max_attempts=3, backoff=1.0,
+                 put_timeout=5.0, drain_timeout=30.0, metrics=None, context=nullcontext):
+        self.backend = SQLiteBackend(path) if path else MemoryBackend()
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.put_timeout = put_timeout
+        self.drain_timeout = drain_timeout
+        self.metrics = metrics
+        self.context = context
+        self.handlers = {}
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._stopping = False
+        atexit.register(self.shutdown)
+
+    def task(self, name):
+        """Decorator registering a handler under a name."""
+        def register(fn):
+            self.handlers[name] = fn
+            return fn
+        return register
+
+    def enqueue(self, name, *args, key=None):
+        """Queue handlers[name](*args) to run in the background."""
+        if name not in self.handlers:
+            raise KeyError('No task handler named %r' % name)
+        if self._closed:
+            return self._run_inline(name, args)
+        self._start()
+        deadline = time.monotonic() + self.put_timeout
+        while self.backend.pending() >= self.max_pending:
+            if time.monotonic() >= deadline:
+                self._count(name, 'inline')
+                return self._run_inline(name, args)
+            time.sleep(0.05)
+        if self.backend.put(name, list(args), key=key):
+            self._count(name, 'queued')
+        else:
+            self._count(name, 'coalesced')
+
+    def _run_inline(self, name, args):
+        with self.context():
+            self.handlers[name](*args)
+
+    def _start(self):
+        if len(self._threads) == self.workers:
+            return
+        with self._start_lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name='task-worker-%d' % len(self._threads),
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self.backend.claim(POLL_SECONDS)
+            if task is None:
+                if self._stopping:
+                    return
+                continue
+            try:
+                with self.context():
+                    self.handlers[task.name](*task.args)
+            except Exception:
+                if task.attempts + 1 < self.max_attempts:
+                    delay = self.backoff * 2 ** task.attempts
+                    log.warning('Task %s failed; retrying in %.1fs', task.name, delay, exc_info=True)
+                    self.backend.retry(task, time.time() + delay)
+                    self._count(task.name, 'retried')
+                else:
+                    log.exception('Task %s failed after %d attempts', task.name, task.attempts + 1)
+                    self.backend.done(task, failed=True)
+                    self._count(task.name, 'failed')
+            else:
+                self.backend.done(task)
+                self._count(task.name, 'done')
+
+    def _count(self, name, status):
+        if self.metrics is not None:
+            self.metrics.inc('tasks_total', (('task', name), ('status', status)))
+
+    def drain(self, timeout=None):
+        """Wait until nothing is queued or running; False on timeout."""
+        deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+        while not self.backend.idle():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self):
+        """Stop taking new tasks and let the queued ones finish."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._threads and not self.drain():
+            log.warning('Task queue shut down with %d tasks pending', self.backend.pending())
+        self._stopping = True
+        for thread in self._threads:
+            thread.join(POLL_SECONDS * 2)
+        self.backend.close()
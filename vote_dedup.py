@@ -0,0 +1,291 @@
+"""One vote per voter per item, in bounded memory.
+
+Voters are reduced to a salted 64-bit hash (the user id when logged in,
+the client IP otherwise), so raw IPs are never kept. Every accepted vote
+appends (item kind, item id, voter hash) to a small binary log that each
+worker tails, like the vote event log, so a duplicate is caught whichever
+worker served the first vote.
+
+In memory each item keeps a sorted ``array('Q')`` of voter hashes, 8 bytes
+per vote. A fixed-size Bloom filter over (item, voter) pairs sits in front
+of it: most first votes are answered by the filter alone, and the exact
+sets only settle the "maybe seen" cases. Filter saturation can only cost
+speed, never correctness.
+
+Once COMPACT_BYTES of log have been folded in, the arrays and the filter
+are written to a snapshot next to the log and a fresh log is started, so
+startup reads the snapshot plus a short tail.
+"""
+import os
+import sys
+import fcntl
+import heapq
+import struct
+import hashlib
+import threading
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from contextlib import contextmanager
+
+RECORD = struct.Struct('<B16sQ')  # item kind, item id, voter hash
+KINDS = {'story': 0, 'comment': 1}
+
+COMPACT_BYTES = 4 * 1024 * 1024  # compact the log once this much has been folded in
+COMPACT_MAGIC = b'YCVOTER1'
+COMPACT_HEADER = struct.Struct('<8sII')  # magic, filter bytes, item count
+SECTION = struct.Struct('<B16sI')         # item kind, item id, voter count; then the hashes
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+BLOOM_BITS = 1 << 24  # 2 MB; about 1% false positives at 1.7M votes
+BLOOM_HASHES = 4
+INSORT_RATIO = 32  # insert one by one while the batch is this much smaller than the array
+
+
+class BloomFilter:
+    """Bit array probed with double hashing of a 64-bit key."""
+
+    def __init__(self, bits=BLOOM_BITS, hashes=BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray(bits // 8)
+
+    def _positions(self, key):
+        h1, h2, bits = key & 0xFFFFFFFF, key >> 32 | 1, self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, key):
+        self.update((key,))
+
+    def update(self, keys):
+        # The probe loop is inlined: this runs once per vote in the log on
+        # a cold start.
+        bits, size, hashes = self.array, self.bits, self.hashes
+        for key in keys:
+            h1, h2 = key & 0xFFFFFFFF, key >> 32 | 1
+            for i in range(hashes):
+                p = (h1 + i * h2) % size
+                bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        bits = self.array
+        for p in self._positions(key):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class VoteDeduper:
+    """Tracks which voters have voted on which items, shared via a log file."""
+
+    def __init__(self, path, salt_path, salt=None, compact_bytes=COMPACT_BYTES):
+        self.path = path
+        self.compact_path = path + '.compact'
+        self.salt_path = salt_path
+        self.compact_bytes = compact_bytes
+        # A configured salt string takes the place of the salt file.
+        self._salt = hashlib.blake2b(salt.encode('utf-8'), digest_size=16).digest() if salt else None
+        self._lock = threading.Lock()
+        self._inode = None
+        self._offset = 0
+        self._voters = {}
+        self._bloom = BloomFilter()
+
+    @property
+    def salt(self):
+        # Loaded on the first vote rather than at import, so a read-only
+        # deployment that never takes votes never writes the salt file.
+        if self._salt is None:
+            self._salt = _load_salt(self.salt_path)
+        return self._salt
+
+    def voter_hash(self, voter):
+        digest = hashlib.blake2b(voter.encode('utf-8'), digest_size=8, key=self.salt).digest()
+        return int.from_bytes(digest, 'little')
+
+    @staticmethod
+    def _pair(item, voter):
+        # Voter hashes are already uniform, so mixing in a hash of the item
+        # is enough. The item hash is stable, so the filter can be saved.
+        return voter ^ _item_hash(item)
+
+    def seen(self, item_type, item_id, voter):
+        """True if this voter hash has already voted on the item."""
+        self.refresh()
+        item = _item(item_type, item_id)
+        if self._pair(item, voter) not in self._bloom:
+            return False
+        voters = self._voters.get(item)
+        if voters is None:
+            return False
+        i = bisect_left(voters, voter)
+        return i < len(voters) and voters[i] == voter
+
+    def record(self, item_type, item_id, voter):
+        with self._flock(fcntl.LOCK_SH), open(self.path, 'ab') as f:
+            f.write(RECORD.pack(*_item(item_type, item_id), voter))
+        self.refresh()
+
+    def refresh(self):
+        """Fold in votes recorded since the last call (by any worker)."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        if st.st_ino == self._inode and st.st_size == self._offset:
+            return
+        with self._lock:
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._reload()  # first load, or the log was compacted by another worker
+            else:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    self._offset += self._fold(f.read(st.st_size - self._offset))
+            if self._offset > self.compact_bytes:
+                self._compact()
+
+    def _fold(self, chunk):
+        """Fold whole records from chunk in; the number of bytes used."""
+        usable = len(chunk) - len(chunk) % RECORD.size
+        added, pairs, pair = {}, [], self._pair
+        for kind, raw, voter in RECORD.iter_unpack(chunk[:usable]):
+            item = (kind, raw.rstrip(b'\0'))
+            added.setdefault(item, set()).add(voter)
+            pairs.append(pair(item, voter))
+        self._bloom.update(pairs)
+        for item, voters in added.items():
+            self._voters[item] = _insert_sorted(self._voters.get(item), sorted(voters))
+        return usable
+
+    # ─── Compaction ───────────────────────────────────────────────────────
+    # Records are unique, so the log can't shrink; instead it is folded into
+    # a snapshot of the sorted arrays and the filter bits, which loads with a
+    # few large reads instead of one Python step per vote. Appends hold a
+    # shared flock and compaction an exclusive one, so none is lost.
+
+    @contextmanager
+    def _flock(self, mode):
+        try:
+            lock = open(self.path + '.lock', 'a')
+        except OSError:
+            yield  # a read-only directory: nobody can be writing
+            return
+        with lock:
+            fcntl.flock(lock, mode)
+            yield
+
+    def _reload(self):
+        with self._flock(fcntl.LOCK_SH):
+            self._voters, self._bloom = {}, BloomFilter()
+            self._load_compacted()
+            with open(self.path, 'rb') as f:
+                self._inode = os.fstat(f.fileno()).st_ino
+                self._offset = self._fold(f.read())
+
+    def _load_compacted(self):
+        try:
+            with open(self.compact_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        if len(data) < COMPACT_HEADER.size:
+            return
+        magic, bloom_bytes, items = COMPACT_HEADER.unpack_from(data)
+        if magic != COMPACT_MAGIC:
+            return
+        pos = COMPACT_HEADER.size
+        bloom = data[pos:pos + bloom_bytes]
+        pos += bloom_bytes
+        rebuild = len(bloom) != len(self._bloom.array)
+        if not rebuild:
+            self._bloom.array = bytearray(bloom)
+        for _ in range(items):
+            kind, raw, count = SECTION.unpack_from(data, pos)
+            pos += SECTION.size
+            voters = array('Q')
+            voters.frombytes(data[pos:pos + 8 * count])
+            pos += 8 * count
+            if _BIG_ENDIAN:
+                voters.byteswap()
+            item = (kind, raw.rstrip(b'\0'))
+            self._voters[item] = voters
+            if rebuild:  # the filter size changed since the snapshot was taken
+                self._bloom.update(self._pair(item, v) for v in voters)
+
+    def _compact(self):
+        try:
+            with self._flock(fcntl.LOCK_EX):
+                st = os.stat(self.path)
+                if st.st_ino != self._inode:
+                    return  # another worker compacted first; the next refresh reloads
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    self._offset += self._fold(f.read(st.st_size - self._offset))
+                parts = [COMPACT_HEADER.pack(COMPACT_MAGIC, len(self._bloom.array), len(self._voters)),
+                         bytes(self._bloom.array)]
+                for (kind, raw), voters in self._voters.items():
+                    parts.append(SECTION.pack(kind, raw, len(voters)))
+                    if _BIG_ENDIAN:
+                        voters = array('Q', voters)
+                        voters.byteswap()
+                    parts.append(voters.tobytes())
+                tmp = '%s.%d.tmp' % (self.compact_path, os.getpid())
+                with open(tmp, 'wb') as f:
+                    f.write(b''.join(parts))
+                os.replace(tmp, self.compact_path)
+                # The snapshot goes first, so a crash here only replays records
+                # that are already in it, which is harmless.
+                tmp = '%s.%d.tmp' % (self.path, os.getpid())
+                open(tmp, 'wb').close()
+                os.replace(tmp, self.path)
+                self._inode, self._offset = os.stat(self.path).st_ino, 0
+        except OSError:
+            pass  # e.g. read-only; the log keeps growing until it can be compacted
+
+
+def _item(item_type, item_id):
+    return KINDS[item_type], item_id.encode('utf-8')[:16]
+
+
+@lru_cache(maxsize=65536)
+def _item_hash(item):
+    kind, raw = item
+    return int.from_bytes(hashlib.blake2b(bytes([kind]) + raw, digest_size=8).digest(), 'little')
+
+
+def _insert_sorted(voters, new):
+    """Merge sorted new hashes into a sorted array, skipping ones already in it.
+
+    A few new hashes are inserted in place; a large batch is merged with the
+    existing run in one pass. Either way the existing array is never re-sorted.
+    """
+    if not voters:
+        return array('Q', new)
+    if len(new) * INSORT_RATIO < len(voters):
+        for voter in new:
+            i = bisect_left(voters, voter)
+            if i == len(voters) or voters[i] != voter:
+                voters.insert(i, voter)
+        return voters
+    merged, last = array('Q'), None
+    for voter in heapq.merge(voters, new):
+        if voter != last:
+            merged.append(voter)
+            last = voter
+    return merged
+
+
+def _load_salt(path):
+    """A per-deployment random salt, created once and shared by all workers."""
+    if not os.path.exists(path):
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(os.urandom(16))
+        try:
+            os.link(tmp, path)  # atomic create; the first worker wins
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    with open(path, 'rb') as f:
+        return f.read()